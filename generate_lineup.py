@@ -3,48 +3,47 @@
 Generate HDHomeRun lineup.json from M3U playlist for GitHub Pages
 """
 
+import sys
 import json
 import re
+from pathlib import Path
 
-def parse_m3u_to_lineup(m3u_file, output_file):
-    """Parse M3U file and create HDHomeRun lineup.json"""
+ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT / "src" / "core"))
+sys.path.insert(0, str(ROOT / "src" / "utils"))
+
+from content_manager import ContentManager
+from hdhomerun_emulator import parse_lineup
+
+def parse_m3u_to_lineup(m3u_file, output_file, db_path='iptv_content.db'):
+    """Parse M3U file and create HDHomeRun lineup.json
+    
+    Guide numbers come from the database, so channels keep their numbers
+    when the playlist is reordered (shared with the HDHomeRun emulator).
+    """
     print(f"📺 Parsing {m3u_file}...")
     
     channels = []
-    channel_id = 1
     
     try:
         with open(m3u_file, 'r', encoding='utf-8') as f:
             content = f.read()
         
-        lines = content.split('\n')
-        i = 0
+        with ContentManager(db_path) as manager:
+            manager.sync_guide_numbers(parse_lineup(content))
+            numbered = manager.get_guide_numbers()
         
-        while i < len(lines):
-            line = lines[i].strip()
+        for entry in numbered:
+            # Clean up channel name for HDHomeRun
+            clean_name = re.sub(r'[^\w\s-]', '', entry['name'])[:50]  # Limit length and remove special chars
             
-            if line.startswith('#EXTINF:'):
-                # Extract channel name
-                name_match = re.search(r',(.+)$', line)
-                name = name_match.group(1).strip() if name_match else f"Channel {channel_id}"
-                
-                # Get URL from next line
-                if i + 1 < len(lines):
-                    url = lines[i + 1].strip()
-                    if url.startswith('http'):
-                        # Clean up channel name for HDHomeRun
-                        clean_name = re.sub(r'[^\w\s-]', '', name)[:50]  # Limit length and remove special chars
-                        
-                        channel = {
-                            "GuideNumber": str(channel_id),
-                            "GuideName": clean_name,
-                            "URL": url,
-                            "HD": 1
-                        }
-                        channels.append(channel)
-                        channel_id += 1
-                        i += 1  # Skip URL line
-            i += 1
+            channel = {
+                "GuideNumber": str(entry['number']),
+                "GuideName": clean_name,
+                "URL": entry['url'],
+                "HD": 1
+            }
+            channels.append(channel)
         
         print(f"✅ Found {len(channels)} channels")
         
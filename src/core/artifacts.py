@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+IPTV Rendered Artifacts
+Caches fully rendered catalog documents on disk, keyed by catalog version
+"""
+
+import os
+import asyncio
+import logging
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+from compression import ARTIFACT_LEVELS, SUFFIXES, StreamCompressor
+
+logger = logging.getLogger(__name__)
+
+class RenderedArtifact:
+    """A rendered document on disk for one catalog version, plus precompressed variants"""
+
+    def __init__(self, name: str, version: int, updated_at: str, path: Path,
+                 variants: Optional[Dict[str, Path]] = None):
+        self.version = version
+        self.updated_at = updated_at
+        self.path = path
+        self.variants = variants or {}
+        self.etag = f'"{name}-v{version}"'
+
+class ArtifactCache:
+    """Keeps the latest rendering of a catalog document and rebuilds it in the background
+
+    render() is called on a worker thread and must yield the document as
+    text chunks; it should read the catalog through its own iterators.
+    """
+
+    def __init__(self, name: str, suffix: str, render: Callable[[], Iterable[str]], directory: Path,
+                 encodings: Iterable[str] = ()):
+        self.name = name
+        self.suffix = suffix
+        self.render = render
+        self.directory = Path(directory)
+        self.encodings: List[str] = list(encodings)
+        self.current: Optional[RenderedArtifact] = None
+        self._build_task: Optional[asyncio.Task] = None
+
+    def get(self, version: int, updated_at: str) -> Optional[RenderedArtifact]:
+        """Return the newest artifact (possibly stale), scheduling a rebuild if it is behind version"""
+        if self.current is None or self.current.version != version:
+            self.refresh(version, updated_at)
+        return self.current
+
+    def refresh(self, version: int, updated_at: str):
+        """Start a background rebuild unless one is already running"""
+        if self._build_task is None or self._build_task.done():
+            self._build_task = asyncio.get_running_loop().create_task(self._build(version, updated_at))
+
+    async def close(self):
+        """Cancel any in-flight rebuild"""
+        if self._build_task is not None and not self._build_task.done():
+            self._build_task.cancel()
+            try:
+                await self._build_task
+            except asyncio.CancelledError:
+                pass
+
+    async def _build(self, version: int, updated_at: str):
+        try:
+            artifact = await asyncio.to_thread(self._render_to_disk, version, updated_at)
+        except Exception as e:
+            logger.error(f"Error rendering {self.name} v{version}: {e}")
+            return
+
+        previous, self.current = self.current, artifact
+        logger.info(f"Rendered {self.name} v{version} ({artifact.path.stat().st_size} bytes)")
+
+        # Keep the previous rendering (and its variants) for responses that already picked it up
+        keep = [artifact.path.name] + ([previous.path.name] if previous else [])
+        for path in self.directory.glob(f"{self.name}-v*"):
+            if not path.name.startswith(tuple(keep)) and not path.name.endswith(".tmp"):
+                path.unlink(missing_ok=True)
+
+    def _render_to_disk(self, version: int, updated_at: str) -> RenderedArtifact:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{self.name}-v{version}{self.suffix}"
+        variants = {encoding: path.with_name(path.name + SUFFIXES[encoding]) for encoding in self.encodings}
+        compressors = {encoding: StreamCompressor(encoding, ARTIFACT_LEVELS[encoding]) for encoding in self.encodings}
+
+        # Render once, writing the plain file and every compressed variant in the same pass
+        outputs = {None: open(path.with_name(path.name + ".tmp"), "wb")}
+        try:
+            for encoding, variant in variants.items():
+                outputs[encoding] = open(variant.with_name(variant.name + ".tmp"), "wb")
+            for chunk in self.render():
+                data = chunk.encode("utf-8")
+                outputs[None].write(data)
+                for encoding, compressor in compressors.items():
+                    outputs[encoding].write(compressor.compress(data))
+            for encoding, compressor in compressors.items():
+                outputs[encoding].write(compressor.finish())
+        finally:
+            for output in outputs.values():
+                output.close()
+
+        for target in [path] + list(variants.values()):
+            os.replace(target.with_name(target.name + ".tmp"), target)
+
+        return RenderedArtifact(self.name, version, updated_at, path, variants)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+IPTV Request Coalescing
+Single-flight sharing of identical in-flight work with per-endpoint concurrency limits
+"""
+
+import asyncio
+import threading
+from typing import Callable, Dict, Hashable, Iterable, Iterator
+
+class Overloaded(Exception):
+    """Raised when an endpoint is already running as many computations as it allows"""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"{name} is overloaded, retry in {retry_after}s")
+        self.name = name
+        self.retry_after = retry_after
+
+class SingleFlight:
+    """Runs each distinct blocking computation once, however many callers ask for it
+
+    Callers that arrive while a computation with the same key is running
+    await that computation's result instead of starting their own. Distinct
+    keys run concurrently up to limit; beyond that Overloaded is raised.
+    Results are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, name: str, limit: int, retry_after: int = 1):
+        self.name = name
+        self.limit = limit
+        self.retry_after = retry_after
+        self.active = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    def _acquire(self):
+        with self._lock:
+            if self.active >= self.limit:
+                raise Overloaded(self.name, self.retry_after)
+            self.active += 1
+
+    def _release(self):
+        with self._lock:
+            self.active -= 1
+
+    async def run(self, key: Hashable, func: Callable, *args):
+        """Return func(*args), computed on a worker thread and shared with concurrent callers of key"""
+        task = self._inflight.get(key)
+        if task is None:
+            self._acquire()
+            task = asyncio.get_running_loop().create_task(self._execute(func, args))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # A caller that disconnects must not cancel the work other callers are waiting on
+        return await asyncio.shield(task)
+
+    async def _execute(self, func: Callable, args: tuple):
+        try:
+            return await asyncio.to_thread(func, *args)
+        finally:
+            self._release()
+
+    def stream(self, chunks: Iterable) -> Iterator:
+        """Count a streamed response against the limit until it is fully sent
+
+        Streams cannot be shared, so this only applies the concurrency limit.
+        The slot is taken immediately (so Overloaded can still become a 503)
+        and released when iteration ends, the stream is closed, or it is
+        dropped without ever being iterated.
+        """
+        self._acquire()
+        return SlotStream(self, chunks)
+
+class SlotStream:
+    """Iterator that holds one SingleFlight slot until it is exhausted, closed or garbage collected
+
+    A generator's finally never runs if the generator was not started, so
+    a response dropped before its first chunk would leak the slot; this
+    releases it from __del__ as well.
+    """
+
+    def __init__(self, flight: SingleFlight, chunks: Iterable):
+        self._flight = flight
+        self._chunks = iter(chunks)
+        self._held = True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._chunks)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self._held:
+            self._held = False
+            self._flight._release()
+            close = getattr(self._chunks, "close", None)
+            if close:
+                close()
+
+    def __del__(self):
+        self.close()
+
+def build_flights(settings: Dict, defaults: Dict[str, int]) -> Dict[str, SingleFlight]:
+    """Create one SingleFlight per endpoint from the config.json concurrency section"""
+    limits = {**defaults, **settings.get("limits", {})}
+    retry_after = settings.get("retry_after", 1)
+    return {name: SingleFlight(name, limit, retry_after) for name, limit in limits.items()}
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+IPTV Response Compression
+Content-encoding negotiation plus streaming gzip/brotli compressors
+"""
+
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP = "gzip"
+BROTLI = "br"
+
+# File suffix of each precompressed variant
+SUFFIXES = {GZIP: ".gz", BROTLI: ".br"}
+
+# Levels for artifacts compressed once per catalog version
+ARTIFACT_LEVELS = {GZIP: 9, BROTLI: 9}
+
+def available_encodings() -> List[str]:
+    """Encodings this server can produce, in order of preference"""
+    return [BROTLI, GZIP] if brotli is not None else [GZIP]
+
+def choose_encoding(accept_encoding: Optional[str], available: Iterable[str]) -> Optional[str]:
+    """Pick the preferred available encoding the client accepts (None means identity)"""
+    if not accept_encoding:
+        return None
+
+    accepted = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+
+    for encoding in available:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+def representation_etag(etag: str, encoding: Optional[str]) -> str:
+    """Derive the strong ETag of an encoded representation"""
+    if not encoding:
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+class StreamCompressor:
+    """Incremental compressor with a uniform interface over zlib and brotli"""
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == GZIP:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        elif encoding == BROTLI and brotli is not None:
+            self._compressor = brotli.Compressor(quality=level)
+        else:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == GZIP:
+            return self._compressor.compress(data)
+        return self._compressor.process(data)
+
+    def finish(self) -> bytes:
+        if self.encoding == GZIP:
+            return self._compressor.flush()
+        return self._compressor.finish()
+
+def compress_chunks(chunks: Iterable[str], encoding: str, level: int) -> Iterator[bytes]:
+    """Encode and compress text chunks as they are produced"""
+    compressor = StreamCompressor(encoding, level)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.finish()
+
+def read_ahead(chunks: Iterator[str], min_size: int) -> Tuple[List[str], bool]:
+    """Pull chunks until min_size characters are buffered; returns (buffered, exhausted)"""
+    buffered = []
+    size = 0
+    for chunk in chunks:
+        buffered.append(chunk)
+        size += len(chunk)
+        if size >= min_size:
+            return buffered, False
+    return buffered, True
+
+def compression_levels(settings: Dict) -> Dict[str, int]:
+    """On-the-fly compression levels from the config.json compression section"""
+    return {
+        GZIP: settings.get("gzip_level", 6),
+        BROTLI: settings.get("brotli_quality", 5)
+    }
@@ -5,22 +5,126 @@ Manages TV channels, movies, and shows for the IPTV server
 """
 
 import os
+import re
+import sys
 import json
 import sqlite3
+import threading
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Iterable, Iterator, Callable
+from itertools import islice
 from datetime import datetime
 import hashlib
 import mimetypes
 
+CONTENT_TYPES = ('live', 'movie', 'series')
+
+def classify_content(url: str) -> str:
+    """Classify a channel URL as live, movie or series (Xtream Codes URL layout)"""
+    if '/movie/' in url:
+        return 'movie'
+    if '/series/' in url:
+        return 'series'
+    return 'live'
+
 class ContentManager:
+    # Tuning applied to every pooled connection
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA cache_size=-20000",
+        "PRAGMA temp_store=MEMORY",
+    )
+    STATEMENT_CACHE_SIZE = 256
+    
+    INSERT_CHANNEL_SQL = '''
+        INSERT INTO channels (name, url, logo, category, language, country, tvg_id, tvg_name, group_title, content_type)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+    PROGRAMME_COLUMNS = ('channel_id', 'start', 'stop', 'title', 'sub_title',
+                         'description', 'category', 'episode_num', 'icon')
+    
     def __init__(self, db_path: str = "iptv_content.db"):
         self.db_path = db_path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._programme_import_lock = threading.Lock()
+        self._idle_readers: List[sqlite3.Connection] = []
+        self._pool_lock = threading.Lock()
+        self._columns_cache: Dict[str, List[str]] = {}
         self.init_database()
     
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def _open_connection(self) -> sqlite3.Connection:
+        """Open a tuned connection and register it with the pool"""
+        # check_same_thread is off so close() can release every connection;
+        # each connection is still only used by one thread or stream at a time
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=self.STATEMENT_CACHE_SIZE
+        )
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        with self._pool_lock:
+            self._connections.append(conn)
+        return conn
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Return the calling thread's pooled connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open_connection()
+            self._local.conn = conn
+        return conn
+    
+    def release_thread_connection(self):
+        """Close the calling thread's pooled connection; call before a short-lived thread exits
+        
+        The pool keeps a connection per thread until close(), so a thread
+        started per task (an import writer, say) would otherwise leave its
+        connection open for the life of the manager.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._pool_lock:
+            if conn not in self._connections:
+                return
+            self._connections.remove(conn)
+        conn.close()
+    
+    def _checkout_reader(self) -> sqlite3.Connection:
+        """Take a connection for a streaming read that may be resumed on other threads"""
+        with self._pool_lock:
+            if self._idle_readers:
+                return self._idle_readers.pop()
+        return self._open_connection()
+    
+    def _checkin_reader(self, conn: sqlite3.Connection):
+        """Return a streaming read connection to the pool"""
+        with self._pool_lock:
+            if conn in self._connections:
+                self._idle_readers.append(conn)
+    
+    def close(self):
+        """Close all pooled connections"""
+        with self._pool_lock:
+            connections, self._connections = self._connections, []
+            self._idle_readers = []
+            self._local = threading.local()
+        for conn in connections:
+            conn.close()
+    
     def init_database(self):
         """Initialize SQLite database for content management"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         # Channels table
@@ -36,11 +140,22 @@ class ContentManager:
                 tvg_id TEXT,
                 tvg_name TEXT,
                 group_title TEXT,
+                content_type TEXT DEFAULT 'live',
+                tvg_match_score REAL,
+                tvg_match_name TEXT,
                 is_active BOOLEAN DEFAULT 1,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        self._migrate_channels(cursor)
+        
+        # Channel indexes for stats, filtered listings and group lookups
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_channels_active_type ON channels (is_active, content_type)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_channels_active_category_name ON channels (is_active, category, name)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_channels_active_name ON channels (is_active, name)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_channels_group_title ON channels (group_title)")
+        self._create_channel_search(cursor)
         
         # Movies table
         cursor.execute('''
@@ -78,6 +193,10 @@ class ContentManager:
             )
         ''')
         
+        # Movie and show listings are keyset-paginated on (title, id)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_movies_active_title ON movies (is_active, title)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_shows_active_title ON shows (is_active, title)")
+        
         # Episodes table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS episodes (
@@ -106,6 +225,60 @@ class ContentManager:
             )
         ''')
         
+        # XMLTV guide channels and programmes, imported by epg.py
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS epg_channels (
+                id TEXT PRIMARY KEY,
+                display_name TEXT,
+                icon TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # start/stop are UTC unix timestamps; channel_id is the XMLTV channel id (tvg_id)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS programmes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel_id TEXT NOT NULL,
+                start INTEGER NOT NULL,
+                stop INTEGER NOT NULL,
+                title TEXT,
+                sub_title TEXT,
+                description TEXT,
+                category TEXT,
+                episode_num TEXT,
+                icon TEXT
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_programmes_channel_time ON programmes (channel_id, start, stop)")
+        
+        # Catalog version at which each guide channel's programmes last changed
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS guide_updates (
+                channel_id TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            )
+        ''')
+        
+        # Stable HDHomeRun guide numbers; rows of channels that left the lineup stay
+        # (inactive) so their numbers are never handed out again
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS guide_numbers (
+                identity TEXT PRIMARY KEY,
+                number INTEGER NOT NULL UNIQUE,
+                tvg_id TEXT,
+                name TEXT,
+                url TEXT,
+                is_active BOOLEAN DEFAULT 1,
+                version INTEGER NOT NULL
+            )
+        ''')
+        self._migrate_guide_numbers(cursor)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_guide_numbers_version ON guide_numbers (version)")
+        
+        self._create_statistics(cursor)
+        self._create_catalog_version(cursor)
+        
         # Insert default categories
         default_categories = [
             ('News', 'News and current affairs'),
@@ -122,17 +295,208 @@ class ContentManager:
             cursor.execute('INSERT OR IGNORE INTO categories (name, description) VALUES (?, ?)', category)
         
         conn.commit()
-        conn.close()
     
-    def add_channel(self, channel_data: Dict) -> int:
-        """Add a new channel to the database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def _migrate_channels(self, cursor: sqlite3.Cursor):
+        """Bring channels tables created by older versions up to the current schema"""
+        cursor.execute("PRAGMA table_info(channels)")
+        columns = {row[1] for row in cursor.fetchall()}
+        
+        if 'content_type' not in columns:
+            # One-off backfill from the URL layout; new rows are classified on insert
+            cursor.execute("ALTER TABLE channels ADD COLUMN content_type TEXT DEFAULT 'live'")
+            cursor.execute("UPDATE channels SET content_type = 'movie' WHERE url LIKE '%/movie/%'")
+            cursor.execute("UPDATE channels SET content_type = 'series' WHERE url LIKE '%/series/%' AND content_type = 'live'")
+        
+        # Guide matching results, see epg_matcher.py
+        if 'tvg_match_score' not in columns:
+            cursor.execute("ALTER TABLE channels ADD COLUMN tvg_match_score REAL")
+            cursor.execute("ALTER TABLE channels ADD COLUMN tvg_match_name TEXT")
+    
+    def _migrate_guide_numbers(self, cursor: sqlite3.Cursor):
+        """Add the tvg_id column to guide_numbers tables created before it existed"""
+        cursor.execute("PRAGMA table_info(guide_numbers)")
+        columns = {row[1] for row in cursor.fetchall()}
+        
+        if 'tvg_id' not in columns:
+            # Older rows were keyed "tvg:<id>" when their tvg_id was unique
+            cursor.execute("ALTER TABLE guide_numbers ADD COLUMN tvg_id TEXT")
+            cursor.execute("UPDATE guide_numbers SET tvg_id = substr(identity, 5) WHERE identity LIKE 'tvg:%'")
+    
+    def _create_channel_search(self, cursor: sqlite3.Cursor):
+        """Create the FTS5 channel search index and the triggers keeping it in sync"""
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'channels_fts'")
+        index_exists = cursor.fetchone() is not None
+        
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS channels_fts USING fts5 (
+                    name, tvg_name, group_title,
+                    content='channels', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+                )
+            ''')
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: search_channels falls back to LIKE
+            self.fts_enabled = False
+            return
+        self.fts_enabled = True
         
         cursor.execute('''
-            INSERT INTO channels (name, url, logo, category, language, country, tvg_id, tvg_name, group_title)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+            CREATE TRIGGER IF NOT EXISTS channels_fts_insert AFTER INSERT ON channels BEGIN
+                INSERT INTO channels_fts (rowid, name, tvg_name, group_title)
+                VALUES (new.id, new.name, new.tvg_name, new.group_title);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS channels_fts_delete AFTER DELETE ON channels BEGIN
+                INSERT INTO channels_fts (channels_fts, rowid, name, tvg_name, group_title)
+                VALUES ('delete', old.id, old.name, old.tvg_name, old.group_title);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS channels_fts_update AFTER UPDATE OF name, tvg_name, group_title ON channels BEGIN
+                INSERT INTO channels_fts (channels_fts, rowid, name, tvg_name, group_title)
+                VALUES ('delete', old.id, old.name, old.tvg_name, old.group_title);
+                INSERT INTO channels_fts (rowid, name, tvg_name, group_title)
+                VALUES (new.id, new.name, new.tvg_name, new.group_title);
+            END
+        ''')
+        
+        if not index_exists:
+            # Index channels imported before search existed
+            cursor.execute("INSERT INTO channels_fts (channels_fts) VALUES ('rebuild')")
+    
+    def _create_statistics(self, cursor: sqlite3.Cursor):
+        """Create the content_stats counters and the triggers keeping them current
+        
+        Rows are keyed by (scope, name): channel counts per content_type and per
+        category, plus item counts and byte totals for active movies and episodes.
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'content_stats'")
+        stats_exist = cursor.fetchone() is not None
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS content_stats (
+                scope TEXT NOT NULL,
+                name TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                bytes INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (scope, name)
+            )
+        ''')
+        
+        def add(scope, name, size, row):
+            return f'''
+                INSERT INTO content_stats (scope, name, count, bytes)
+                SELECT '{scope}', {name}, 1, {size} WHERE {row}.is_active = 1
+                ON CONFLICT (scope, name) DO UPDATE SET count = count + 1, bytes = bytes + excluded.bytes;
+            '''
+        
+        def remove(scope, name, size, row):
+            return f'''
+                UPDATE content_stats SET count = count - 1, bytes = bytes - {size}
+                WHERE {row}.is_active = 1 AND scope = '{scope}' AND name = {name};
+            '''
+        
+        # (table, columns whose change affects counters, [(scope, name expr, size expr)])
+        counters = [
+            ('channels', 'is_active, content_type, category', [
+                ('content_type', "COALESCE({row}.content_type, '')", '0'),
+                ('category', "COALESCE({row}.category, '')", '0'),
+            ]),
+            ('movies', 'is_active, file_size', [
+                ('movies', "''", 'COALESCE({row}.file_size, 0)'),
+            ]),
+            ('episodes', 'is_active, file_size', [
+                ('episodes', "''", 'COALESCE({row}.file_size, 0)'),
+            ]),
+        ]
+        
+        for table, watched, scopes in counters:
+            on_insert = ''.join(add(scope, name.format(row='new'), size.format(row='new'), 'new')
+                                for scope, name, size in scopes)
+            on_delete = ''.join(remove(scope, name.format(row='old'), size.format(row='old'), 'old')
+                                for scope, name, size in scopes)
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_stats_insert AFTER INSERT ON {table} BEGIN {on_insert} END")
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_stats_delete AFTER DELETE ON {table} BEGIN {on_delete} END")
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_stats_update AFTER UPDATE OF {watched} ON {table} "
+                           f"BEGIN {on_delete} {on_insert} END")
+        
+        if not stats_exist:
+            # Seed counters for content imported before the stats table existed
+            self._rebuild_statistics(cursor)
+    
+    def _rebuild_statistics(self, cursor: sqlite3.Cursor):
+        """Recompute every content_stats row from the content tables"""
+        cursor.execute("DELETE FROM content_stats")
+        cursor.execute('''
+            INSERT INTO content_stats (scope, name, count, bytes)
+            SELECT 'content_type', COALESCE(content_type, ''), COUNT(*), 0
+            FROM channels WHERE is_active = 1 GROUP BY 1, 2
+            UNION ALL
+            SELECT 'category', COALESCE(category, ''), COUNT(*), 0
+            FROM channels WHERE is_active = 1 GROUP BY 1, 2
+            UNION ALL
+            SELECT 'movies', '', COUNT(*), COALESCE(SUM(file_size), 0)
+            FROM movies WHERE is_active = 1
+            UNION ALL
+            SELECT 'episodes', '', COUNT(*), COALESCE(SUM(file_size), 0)
+            FROM episodes WHERE is_active = 1
+        ''')
+    
+    def rebuild_statistics(self):
+        """Repair the content_stats counters by recomputing them from scratch"""
+        conn = self._connect()
+        with conn:
+            self._rebuild_statistics(conn.cursor())
+    
+    def _create_catalog_version(self, cursor: sqlite3.Cursor):
+        """Create the single-row catalog version that every channel write bumps"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS catalog_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)")
+        
+        # Channel writes that change which guide ids active channels carry also flag
+        # those ids in guide_updates, stamped after the bump, for the now/next index
+        mark = '''
+            INSERT INTO guide_updates (channel_id, version)
+            SELECT {row}.tvg_id, version FROM catalog_version
+            WHERE id = 1 AND COALESCE({row}.tvg_id, '') != ''{condition}
+            ON CONFLICT (channel_id) DO UPDATE SET version = excluded.version;
+        '''
+        changed = " AND (OLD.tvg_id IS NOT NEW.tvg_id OR OLD.is_active IS NOT NEW.is_active)"
+        marks = {
+            'INSERT': mark.format(row='NEW', condition=''),
+            'UPDATE': mark.format(row='OLD', condition=changed) + mark.format(row='NEW', condition=changed),
+            'DELETE': mark.format(row='OLD', condition='')
+        }
+        for event, guide_marks in marks.items():
+            # Superseded by the channels_catalog_* triggers below, which also mark guide updates
+            cursor.execute(f"DROP TRIGGER IF EXISTS channels_version_{event.lower()}")
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS channels_catalog_{event.lower()} AFTER {event} ON channels BEGIN
+                    UPDATE catalog_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+                    {guide_marks}
+                END
+            ''')
+    
+    def _bump_catalog_version(self, conn: sqlite3.Connection):
+        """Advance the catalog version for writes that triggers do not cover (bulk guide imports)"""
+        conn.execute("UPDATE catalog_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1")
+    
+    def get_catalog_version(self) -> Tuple[int, str]:
+        """Get the catalog version (channels and guide) and its UTC change time ('YYYY-MM-DD HH:MM:SS')"""
+        cursor = self._connect().execute("SELECT version, updated_at FROM catalog_version WHERE id = 1")
+        return cursor.fetchone()
+    
+    def _channel_row(self, channel_data: Dict) -> Tuple:
+        """Build the channels INSERT parameters for a channel dict"""
+        return (
             channel_data['name'],
             channel_data['url'],
             channel_data.get('logo', ''),
@@ -141,190 +505,576 @@ class ContentManager:
             channel_data.get('country', 'US'),
             channel_data.get('tvg_id', ''),
             channel_data.get('tvg_name', ''),
-            channel_data.get('group_title', '')
-        ))
-        
-        channel_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+            channel_data.get('group_title', ''),
+            channel_data.get('content_type') or classify_content(channel_data['url'])
+        )
+    
+    def add_channel(self, channel_data: Dict) -> int:
+        """Add a new channel to the database"""
+        conn = self._connect()
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute(self.INSERT_CHANNEL_SQL, self._channel_row(channel_data))
+            channel_id = cursor.lastrowid
         
         return channel_id
     
-    def add_movie(self, movie_data: Dict) -> int:
-        """Add a new movie to the database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def add_channels(self, channels: Iterable[Dict], batch_size: int = 1000,
+                     progress: Optional[Callable[[int], None]] = None) -> List[int]:
+        """Add many channels using one executemany transaction per batch
         
-        # Calculate file hash and size if file exists
-        file_hash = ""
-        file_size = 0
-        if os.path.exists(movie_data['file_path']):
-            file_hash = self._calculate_file_hash(movie_data['file_path'])
-            file_size = os.path.getsize(movie_data['file_path'])
+        Consumes any iterable (generators included) without materializing it,
+        calls progress(total_inserted) after each committed batch and returns
+        the assigned channel ids in input order.
+        """
+        conn = self._connect()
+        channel_ids = []
         
-        cursor.execute('''
-            INSERT INTO movies (title, file_path, year, genre, description, poster, duration, file_size, file_hash)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            movie_data['title'],
-            movie_data['file_path'],
-            movie_data.get('year'),
-            movie_data.get('genre', ''),
-            movie_data.get('description', ''),
-            movie_data.get('poster', ''),
-            movie_data.get('duration', 0),
-            file_size,
-            file_hash
-        ))
-        
-        movie_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        rows = (self._channel_row(channel) for channel in channels)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            
+            with conn:
+                cursor = conn.cursor()
+                cursor.executemany(self.INSERT_CHANNEL_SQL, batch)
+                # AUTOINCREMENT ids are handed out sequentially while this
+                # transaction holds the write lock, so the batch ends at seq
+                cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'channels'")
+                last_id = cursor.fetchone()[0]
+            
+            channel_ids.extend(range(last_id - len(batch) + 1, last_id + 1))
+            if progress:
+                progress(len(channel_ids))
+        
+        return channel_ids
+    
+    def add_epg_channels(self, channels: Iterable[Dict]) -> int:
+        """Insert or update XMLTV guide channels by id"""
+        rows = [(channel['id'], channel.get('display_name', ''), channel.get('icon', '')) for channel in channels]
+        conn = self._connect()
+        with conn:
+            conn.executemany('''
+                INSERT INTO epg_channels (id, display_name, icon) VALUES (?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET display_name = excluded.display_name,
+                    icon = excluded.icon, updated_at = CURRENT_TIMESTAMP
+            ''', rows)
+        return len(rows)
+    
+    def replace_programmes(self, programmes: Iterable[Dict], batch_size: int = 1000,
+                           progress: Optional[Callable[[int], None]] = None) -> int:
+        """Import programmes, replacing each channel's schedule only within the imported time window
+        
+        Batches are staged on disk as they stream in; the swap into
+        programmes happens in one short transaction at the end, so readers
+        never see a half-replaced guide and channel writes are not blocked
+        for the length of the import. Returns the number imported.
+        """
+        with self._programme_import_lock:
+            return self._replace_programmes(programmes, batch_size, progress)
+    
+    def _replace_programmes(self, programmes: Iterable[Dict], batch_size: int,
+                            progress: Optional[Callable[[int], None]]) -> int:
+        conn = self._connect()
+        columns = ", ".join(self.PROGRAMME_COLUMNS)
+        # A regular table rather than TEMP: temp_store=MEMORY would hold the whole guide in RAM
+        conn.execute(f"CREATE TABLE IF NOT EXISTS programmes_staging ({columns})")
+        with conn:
+            conn.execute("DELETE FROM programmes_staging")
+        
+        insert = f"INSERT INTO programmes_staging ({columns}) VALUES ({', '.join('?' * len(self.PROGRAMME_COLUMNS))})"
+        rows = (tuple(programme.get(column) for column in self.PROGRAMME_COLUMNS) for programme in programmes)
+        # channel_id -> [first start, last stop]; one entry per guide channel
+        windows: Dict[str, List[int]] = {}
+        total = 0
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            with conn:
+                conn.executemany(insert, batch)
+            for channel_id, start, stop, *_ in batch:
+                window = windows.setdefault(channel_id, [start, stop])
+                window[0] = min(window[0], start)
+                window[1] = max(window[1], stop)
+            total += len(batch)
+            if progress:
+                progress(total)
+        
+        with conn:
+            # Drop whatever overlaps each channel's window in the new data
+            conn.executemany("DELETE FROM programmes WHERE channel_id = ? AND start < ? AND stop > ?",
+                             ((channel_id, last, first) for channel_id, (first, last) in windows.items()))
+            conn.execute(f"INSERT INTO programmes ({columns}) SELECT {columns} FROM programmes_staging")
+            conn.execute("DELETE FROM programmes_staging")
+            self._bump_catalog_version(conn)
+            self._mark_guide_updates(conn, windows)
+        
+        return total
+    
+    def get_epg_channels(self) -> List[Tuple[str, str]]:
+        """Get (id, display_name) for every imported guide channel"""
+        cursor = self._connect().execute("SELECT id, display_name FROM epg_channels")
+        return cursor.fetchall()
+    
+    def iter_unmatched_channels(self, incremental: bool = False, batch_size: int = 1000) -> Iterator[sqlite3.Row]:
+        """Stream (id, name) of active channels that need a guide match
+        
+        Those are channels whose tvg_id is missing or unknown to the guide,
+        plus earlier automatic matches. In incremental mode only channels
+        never matched or renamed since their last match are returned.
+        """
+        query = '''
+            SELECT id, name FROM channels
+            WHERE is_active = 1
+              AND (tvg_match_name IS NOT NULL OR COALESCE(tvg_id, '') = ''
+                   OR tvg_id NOT IN (SELECT id FROM epg_channels))
+        '''
+        if incremental:
+            query += " AND (tvg_match_name IS NULL OR tvg_match_name != name)"
+        return self._iter_rows(query, [], batch_size)
+    
+    def set_tvg_matches(self, matches: Iterable[Tuple[int, Optional[str], float, str]],
+                        batch_size: int = 1000) -> int:
+        """Store guide matches as (channel id, tvg_id or None, score, matched name)
+        
+        A None tvg_id records the attempt without changing the channel's
+        tvg_id. The channels triggers flag newly assigned guide ids in
+        guide_updates, so the now/next index picks up their programmes.
+        """
+        conn = self._connect()
+        total = 0
+        matches = iter(matches)
+        while True:
+            batch = list(islice(matches, batch_size))
+            if not batch:
+                break
+            with conn:
+                conn.executemany(
+                    "UPDATE channels SET tvg_id = COALESCE(?, tvg_id), tvg_match_score = ?, tvg_match_name = ? WHERE id = ?",
+                    [(tvg_id, score, name, channel_id) for channel_id, tvg_id, score, name in batch]
+                )
+            total += len(batch)
+        return total
+    
+    def _mark_guide_updates(self, conn: sqlite3.Connection, channel_ids: Iterable[str]):
+        """Record that these guide channels changed at the current catalog version"""
+        conn.executemany('''
+            INSERT INTO guide_updates (channel_id, version)
+            SELECT ?, version FROM catalog_version WHERE id = 1
+            ON CONFLICT (channel_id) DO UPDATE SET version = excluded.version
+        ''', ((channel_id,) for channel_id in channel_ids))
+    
+    def get_guide_updates(self, since: int) -> List[str]:
+        """Get the guide channel ids whose programmes changed after a catalog version"""
+        cursor = self._connect().execute("SELECT channel_id FROM guide_updates WHERE version > ?", (since,))
+        return [row[0] for row in cursor.fetchall()]
+    
+    def sync_guide_numbers(self, entries: Iterable[Tuple[str, str, str]]) -> int:
+        """Assign stable guide numbers to a lineup of (tvg_id, name, url) and return its version
+        
+        Each entry keeps the number of an existing row whose tvg_id and URL
+        both match, failing that one whose tvg_id matches (the provider
+        rotated credentials in its URLs), failing that one whose URL matches
+        (the tvg_id changed or was dropped). Only entries matching no row are
+        numbered after the highest number ever assigned, so HD/SD feeds
+        sharing a tvg_id, or such a duplicate appearing or disappearing,
+        never renumber the others. Rows left unmatched are deactivated,
+        leaving a gap. Every row that changes is stamped with the new lineup
+        version for get_lineup_changes.
+        """
+        conn = self._connect()
+        with conn:
+            # Active rows first, so a channel never moves to the number of a departed twin
+            rows = conn.execute(
+                "SELECT identity, number, tvg_id, name, url, is_active FROM guide_numbers "
+                "ORDER BY is_active DESC, number").fetchall()
+            version, last_number = conn.execute(
+                "SELECT COALESCE(MAX(version), 0), COALESCE(MAX(number), 0) FROM guide_numbers").fetchone()
+            
+            by_feed, by_tvg_id, by_url = {}, {}, {}
+            for row in rows:
+                tvg_id, url = row[2] or "", row[4]
+                by_feed.setdefault((tvg_id, url), []).append(row)
+                if tvg_id:
+                    by_tvg_id.setdefault(tvg_id, []).append(row)
+                by_url.setdefault(url, []).append(row)
+            
+            # Drop repeats of the same feed, then match from the strongest key to the weakest
+            unmatched = list({(tvg_id or "", url): (tvg_id or "", name, url) for tvg_id, name, url in entries}.values())
+            claimed = {}
+            for index, key in ((by_feed, lambda entry: (entry[0], entry[2])),
+                               (by_tvg_id, lambda entry: entry[0]),
+                               (by_url, lambda entry: entry[2])):
+                remaining = []
+                for entry in unmatched:
+                    row = next((row for row in index.get(key(entry), ()) if row[0] not in claimed), None)
+                    if row is None:
+                        remaining.append(entry)
+                    else:
+                        claimed[row[0]] = (row, entry)
+                unmatched = remaining
+            
+            version += 1
+            updates = [(tvg_id, name, url, version, row[0])
+                       for row, (tvg_id, name, url) in claimed.values()
+                       if ((row[2] or ""), row[3], row[4], row[5]) != (tvg_id, name, url, 1)]
+            removed = [(version, row[0]) for row in rows if row[5] and row[0] not in claimed]
+            
+            identities = {row[0] for row in rows}
+            inserts = []
+            for tvg_id, name, url in unmatched:
+                identity = base = f"tvg:{tvg_id}" if tvg_id else f"url:{hashlib.sha1(url.encode()).hexdigest()[:16]}"
+                suffix = 1
+                while identity in identities:
+                    suffix += 1
+                    identity = f"{base}#{suffix}"
+                identities.add(identity)
+                last_number += 1
+                inserts.append((identity, last_number, tvg_id, name, url, version))
+            
+            if not (inserts or updates or removed):
+                return version - 1
+            conn.executemany(
+                "INSERT INTO guide_numbers (identity, number, tvg_id, name, url, is_active, version) "
+                "VALUES (?, ?, ?, ?, ?, 1, ?)",
+                inserts
+            )
+            conn.executemany(
+                "UPDATE guide_numbers SET tvg_id = ?, name = ?, url = ?, is_active = 1, version = ? WHERE identity = ?",
+                updates
+            )
+            conn.executemany("UPDATE guide_numbers SET is_active = 0, version = ? WHERE identity = ?", removed)
+        return version
+    
+    def get_guide_numbers(self) -> List[Dict]:
+        """Get the active lineup as (number, name, url) dicts ordered by guide number"""
+        return self._fetch_dicts(
+            "SELECT number, name, url FROM guide_numbers WHERE is_active = 1 ORDER BY number", [])
+    
+    def get_lineup_changes(self, since: int) -> List[Dict]:
+        """Get lineup entries added, changed or removed (is_active = 0) after a lineup version"""
+        return self._fetch_dicts(
+            "SELECT number, name, url, is_active FROM guide_numbers WHERE version > ? ORDER BY number", [since])
+    
+    def prune_programmes(self, before: int) -> int:
+        """Delete programmes that ended before a UTC unix timestamp"""
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute("DELETE FROM programmes WHERE stop < ?", (before,))
+            if cursor.rowcount:
+                self._bump_catalog_version(conn)
+        return cursor.rowcount
+    
+    def add_movie(self, movie_data: Dict) -> int:
+        """Add a new movie to the database"""
+        conn = self._connect()
+        with conn:
+            cursor = conn.cursor()
+            
+            # Calculate file hash and size if file exists
+            file_hash = ""
+            file_size = 0
+            if os.path.exists(movie_data['file_path']):
+                file_hash = self._calculate_file_hash(movie_data['file_path'])
+                file_size = os.path.getsize(movie_data['file_path'])
+            
+            cursor.execute('''
+                INSERT INTO movies (title, file_path, year, genre, description, poster, duration, file_size, file_hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                movie_data['title'],
+                movie_data['file_path'],
+                movie_data.get('year'),
+                movie_data.get('genre', ''),
+                movie_data.get('description', ''),
+                movie_data.get('poster', ''),
+                movie_data.get('duration', 0),
+                file_size,
+                file_hash
+            ))
+            
+            movie_id = cursor.lastrowid
         
         return movie_id
     
     def add_show(self, show_data: Dict) -> int:
         """Add a new TV show to the database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO shows (title, year, genre, description, poster, total_seasons, total_episodes)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            show_data['title'],
-            show_data.get('year'),
-            show_data.get('genre', ''),
-            show_data.get('description', ''),
-            show_data.get('poster', ''),
-            show_data.get('total_seasons', 0),
-            show_data.get('total_episodes', 0)
-        ))
-        
-        show_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        conn = self._connect()
+        with conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO shows (title, year, genre, description, poster, total_seasons, total_episodes)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                show_data['title'],
+                show_data.get('year'),
+                show_data.get('genre', ''),
+                show_data.get('description', ''),
+                show_data.get('poster', ''),
+                show_data.get('total_seasons', 0),
+                show_data.get('total_episodes', 0)
+            ))
+            
+            show_id = cursor.lastrowid
         
         return show_id
     
     def add_episode(self, episode_data: Dict) -> int:
         """Add a new episode to the database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Calculate file hash and size if file exists
-        file_hash = ""
-        file_size = 0
-        if os.path.exists(episode_data['file_path']):
-            file_hash = self._calculate_file_hash(episode_data['file_path'])
-            file_size = os.path.getsize(episode_data['file_path'])
-        
-        cursor.execute('''
-            INSERT INTO episodes (show_id, season_number, episode_number, title, file_path, duration, file_size, file_hash)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            episode_data['show_id'],
-            episode_data['season_number'],
-            episode_data['episode_number'],
-            episode_data.get('title', ''),
-            episode_data['file_path'],
-            episode_data.get('duration', 0),
-            file_size,
-            file_hash
-        ))
-        
-        episode_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        conn = self._connect()
+        with conn:
+            cursor = conn.cursor()
+            
+            # Calculate file hash and size if file exists
+            file_hash = ""
+            file_size = 0
+            if os.path.exists(episode_data['file_path']):
+                file_hash = self._calculate_file_hash(episode_data['file_path'])
+                file_size = os.path.getsize(episode_data['file_path'])
+            
+            cursor.execute('''
+                INSERT INTO episodes (show_id, season_number, episode_number, title, file_path, duration, file_size, file_hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                episode_data['show_id'],
+                episode_data['season_number'],
+                episode_data['episode_number'],
+                episode_data.get('title', ''),
+                episode_data['file_path'],
+                episode_data.get('duration', 0),
+                file_size,
+                file_hash
+            ))
+            
+            episode_id = cursor.lastrowid
         
         return episode_id
     
-    def get_channels(self, category: str = None, active_only: bool = True) -> List[Dict]:
-        """Get channels from database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def _table_columns(self, table: str) -> List[str]:
+        """Return (and cache) the column names of a table"""
+        if table not in self._columns_cache:
+            cursor = self._connect().execute(f"PRAGMA table_info({table})")
+            self._columns_cache[table] = [row[1] for row in cursor.fetchall()]
+        return self._columns_cache[table]
+    
+    def _check_fields(self, table: str, fields: List[str]):
+        """Raise ValueError if a requested projection names an unknown column"""
+        unknown = [field for field in fields if field not in self._table_columns(table)]
+        if unknown:
+            raise ValueError(f"Unknown {table} fields: {', '.join(unknown)}")
+    
+    def _build_select(self, table: str, sort_column: str, conditions: List[str], params: List,
+                      fields: Optional[List[str]] = None, limit: Optional[int] = None,
+                      after: Optional[Tuple] = None) -> Tuple[str, List]:
+        """Build a keyset-paginated SELECT ordered by (sort_column, id)
         
-        query = "SELECT * FROM channels"
-        params = []
+        fields projects the listed columns (the id and sort column are always
+        included so callers can build the next cursor); after is the
+        (sort_value, id) of the last row of the previous page.
+        """
+        if fields:
+            self._check_fields(table, fields)
+            columns = ['id', sort_column] + [field for field in fields if field not in ('id', sort_column)]
+            query = f"SELECT {', '.join(columns)} FROM {table}"
+        else:
+            query = f"SELECT * FROM {table}"
         
-        conditions = []
-        if active_only:
-            conditions.append("is_active = 1")
-        if category:
-            conditions.append("category = ?")
-            params.append(category)
+        conditions = list(conditions)
+        params = list(params)
+        if after is not None:
+            conditions.append(f"({sort_column}, id) > (?, ?)")
+            params.extend(after)
         
         if conditions:
             query += " WHERE " + " AND ".join(conditions)
         
-        query += " ORDER BY name"
+        query += f" ORDER BY {sort_column}, id"
         
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        
+        return query, params
+    
+    def _fetch_dicts(self, query: str, params: List) -> List[Dict]:
+        """Run a query and return its rows as dicts"""
+        cursor = self._connect().cursor()
         cursor.execute(query, params)
         columns = [description[0] for description in cursor.description]
-        channels = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        
-        conn.close()
-        return channels
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
     
-    def get_movies(self, genre: str = None, active_only: bool = True) -> List[Dict]:
-        """Get movies from database"""
-        conn = sqlite3.connect(self.db_path)
+    def _iter_rows(self, query: str, params: List, batch_size: int) -> Iterator[sqlite3.Row]:
+        """Yield sqlite3.Row objects in fetchmany batches from a checked-out reader"""
+        conn = self._checkout_reader()
         cursor = conn.cursor()
-        
-        query = "SELECT * FROM movies"
-        params = []
-        
+        cursor.row_factory = sqlite3.Row
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            # Closing the cursor ends the read transaction before the
+            # connection goes back to the pool, even if the consumer stopped early
+            cursor.close()
+            self._checkin_reader(conn)
+    
+    def _channel_conditions(self, category: str = None, active_only: bool = True,
+                            content_type: str = None, group_title: str = None,
+                            country: str = None, language: str = None) -> Tuple[List[str], List]:
+        """Build WHERE conditions for the channel filters"""
         conditions = []
+        params = []
         if active_only:
             conditions.append("is_active = 1")
-        if genre:
-            conditions.append("genre = ?")
-            params.append(genre)
-        
+        for column, value in (('category', category), ('content_type', content_type),
+                              ('group_title', group_title), ('country', country),
+                              ('language', language)):
+            if value:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        return conditions, params
+    
+    def get_channel(self, channel_id: int) -> Optional[Dict]:
+        """Get one channel by id"""
+        rows = self._fetch_dicts("SELECT * FROM channels WHERE id = ?", [channel_id])
+        return rows[0] if rows else None
+    
+    def get_channels(self, category: str = None, active_only: bool = True,
+                     content_type: str = None, group_title: str = None,
+                     fields: Optional[List[str]] = None, limit: Optional[int] = None,
+                     after: Optional[Tuple[str, int]] = None) -> List[Dict]:
+        """Get channels from database, ordered by name with optional keyset paging"""
+        conditions, params = self._channel_conditions(category, active_only, content_type, group_title)
+        query, params = self._build_select('channels', 'name', conditions, params, fields, limit, after)
+        return self._fetch_dicts(query, params)
+    
+    def iter_channels(self, category: str = None, active_only: bool = True,
+                      content_type: str = None, group_title: str = None,
+                      country: str = None, language: str = None,
+                      fields: Optional[List[str]] = None,
+                      batch_size: int = 500) -> Iterator[sqlite3.Row]:
+        """Stream channels ordered by name without materializing the result set"""
+        conditions, params = self._channel_conditions(category, active_only, content_type, group_title,
+                                                      country, language)
+        query, params = self._build_select('channels', 'name', conditions, params, fields)
+        return self._iter_rows(query, params, batch_size)
+    
+    def count_channels(self, category: str = None, active_only: bool = True,
+                       content_type: str = None, group_title: str = None,
+                       country: str = None, language: str = None) -> int:
+        """Count channels matching the given filters"""
+        conditions, params = self._channel_conditions(category, active_only, content_type, group_title,
+                                                      country, language)
+        query = "SELECT COUNT(*) FROM channels"
         if conditions:
             query += " WHERE " + " AND ".join(conditions)
+        return self._connect().execute(query, params).fetchone()[0]
+    
+    def get_group_titles(self, active_only: bool = True) -> List[str]:
+        """Get the distinct non-empty channel group titles"""
+        query = "SELECT DISTINCT group_title FROM channels WHERE group_title != ''"
+        if active_only:
+            query += " AND is_active = 1"
+        query += " ORDER BY group_title"
+        return [row[0] for row in self._connect().execute(query).fetchall()]
+    
+    def search_channels(self, query: str, limit: int = 50, category: str = None,
+                        content_type: str = None, fields: Optional[List[str]] = None) -> List[Dict]:
+        """Search active channels by name, tvg_name and group_title
         
-        query += " ORDER BY title"
-        
-        cursor.execute(query, params)
-        columns = [description[0] for description in cursor.description]
-        movies = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        Every word of the query is matched as a prefix and results are ranked
+        with bm25, weighting name over tvg_name over group_title.
+        """
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            return []
         
-        conn.close()
-        return movies
-    
-    def get_shows(self, genre: str = None, active_only: bool = True) -> List[Dict]:
-        """Get TV shows from database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        if fields:
+            self._check_fields('channels', fields)
+            columns = ', '.join(f"c.{field}" for field in ['id'] + [f for f in fields if f != 'id'])
+        else:
+            columns = "c.*"
         
-        query = "SELECT * FROM shows"
+        conditions = ["c.is_active = 1"]
         params = []
+        if self.fts_enabled:
+            conditions.append("channels_fts MATCH ?")
+            params.append(' '.join(f'"{term}"*' for term in terms))
+        else:
+            for term in terms:
+                conditions.append("c.name LIKE ?")
+                params.append(f"%{term}%")
+        if category:
+            conditions.append("c.category = ?")
+            params.append(category)
+        if content_type:
+            conditions.append("c.content_type = ?")
+            params.append(content_type)
         
+        if self.fts_enabled:
+            sql = (f"SELECT {columns} FROM channels_fts JOIN channels c ON c.id = channels_fts.rowid"
+                   f" WHERE {' AND '.join(conditions)}"
+                   " ORDER BY bm25(channels_fts, 10.0, 5.0, 1.0) LIMIT ?")
+        else:
+            sql = f"SELECT {columns} FROM channels c WHERE {' AND '.join(conditions)} ORDER BY c.name LIMIT ?"
+        params.append(limit)
+        
+        return self._fetch_dicts(sql, params)
+    
+    def _genre_conditions(self, genre: str = None, active_only: bool = True) -> Tuple[List[str], List]:
+        """Build WHERE conditions for the movie and show filters"""
         conditions = []
+        params = []
         if active_only:
             conditions.append("is_active = 1")
         if genre:
             conditions.append("genre = ?")
             params.append(genre)
-        
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-        
-        query += " ORDER BY title"
-        
-        cursor.execute(query, params)
-        columns = [description[0] for description in cursor.description]
-        shows = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        
-        conn.close()
-        return shows
+        return conditions, params
     
-    def get_episodes(self, show_id: int, season: int = None) -> List[Dict]:
-        """Get episodes for a specific show"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+    def get_movie(self, movie_id: int) -> Optional[Dict]:
+        """Get one movie by id"""
+        rows = self._fetch_dicts("SELECT * FROM movies WHERE id = ?", [movie_id])
+        return rows[0] if rows else None
+    
+    def get_movies(self, genre: str = None, active_only: bool = True,
+                   fields: Optional[List[str]] = None, limit: Optional[int] = None,
+                   after: Optional[Tuple[str, int]] = None) -> List[Dict]:
+        """Get movies from database, ordered by title with optional keyset paging"""
+        conditions, params = self._genre_conditions(genre, active_only)
+        query, params = self._build_select('movies', 'title', conditions, params, fields, limit, after)
+        return self._fetch_dicts(query, params)
+    
+    def iter_movies(self, genre: str = None, active_only: bool = True,
+                    fields: Optional[List[str]] = None, batch_size: int = 500) -> Iterator[sqlite3.Row]:
+        """Stream movies ordered by title without materializing the result set"""
+        conditions, params = self._genre_conditions(genre, active_only)
+        query, params = self._build_select('movies', 'title', conditions, params, fields)
+        return self._iter_rows(query, params, batch_size)
+    
+    def get_shows(self, genre: str = None, active_only: bool = True,
+                  fields: Optional[List[str]] = None, limit: Optional[int] = None,
+                  after: Optional[Tuple[str, int]] = None) -> List[Dict]:
+        """Get TV shows from database, ordered by title with optional keyset paging"""
+        conditions, params = self._genre_conditions(genre, active_only)
+        query, params = self._build_select('shows', 'title', conditions, params, fields, limit, after)
+        return self._fetch_dicts(query, params)
+    
+    def iter_shows(self, genre: str = None, active_only: bool = True,
+                   fields: Optional[List[str]] = None, batch_size: int = 500) -> Iterator[sqlite3.Row]:
+        """Stream TV shows ordered by title without materializing the result set"""
+        conditions, params = self._genre_conditions(genre, active_only)
+        query, params = self._build_select('shows', 'title', conditions, params, fields)
+        return self._iter_rows(query, params, batch_size)
+    
+    def _episodes_query(self, show_id: int, season: int = None) -> Tuple[str, List]:
+        """Build the episode listing query for a show"""
         query = "SELECT * FROM episodes WHERE show_id = ? AND is_active = 1"
         params = [show_id]
         
@@ -333,13 +1083,61 @@ class ContentManager:
             params.append(season)
         
         query += " ORDER BY season_number, episode_number"
-        
-        cursor.execute(query, params)
-        columns = [description[0] for description in cursor.description]
-        episodes = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        
-        conn.close()
-        return episodes
+        return query, params
+    
+    def get_episode(self, episode_id: int) -> Optional[Dict]:
+        """Get one episode by id"""
+        rows = self._fetch_dicts("SELECT * FROM episodes WHERE id = ?", [episode_id])
+        return rows[0] if rows else None
+    
+    def get_episodes(self, show_id: int, season: int = None) -> List[Dict]:
+        """Get episodes for a specific show"""
+        query, params = self._episodes_query(show_id, season)
+        return self._fetch_dicts(query, params)
+    
+    def iter_episodes(self, show_id: int, season: int = None,
+                      batch_size: int = 500) -> Iterator[sqlite3.Row]:
+        """Stream episodes for a specific show"""
+        query, params = self._episodes_query(show_id, season)
+        return self._iter_rows(query, params, batch_size)
+    
+    def _guide_channel_conditions(self, channel_ids: Optional[List[str]] = None,
+                                  group_title: str = None) -> Tuple[List[str], List]:
+        """Build WHERE conditions selecting active channels that carry a guide id"""
+        conditions, params = self._channel_conditions(group_title=group_title)
+        conditions.append("tvg_id != ''")
+        if channel_ids is not None:
+            conditions.append(f"tvg_id IN ({', '.join('?' * len(channel_ids))})")
+            params.extend(channel_ids)
+        return conditions, params
+    
+    def iter_guide_channels(self, channel_ids: Optional[List[str]] = None, group_title: str = None,
+                            batch_size: int = 500) -> Iterator[sqlite3.Row]:
+        """Stream one (tvg_id, name, logo) row per guide id carried by active channels"""
+        conditions, params = self._guide_channel_conditions(channel_ids, group_title)
+        query = f'''
+            SELECT tvg_id, MIN(name) AS name, MAX(logo) AS logo FROM channels
+            WHERE {" AND ".join(conditions)} GROUP BY tvg_id ORDER BY tvg_id
+        '''
+        return self._iter_rows(query, params, batch_size)
+    
+    def iter_programmes(self, start: Optional[int] = None, stop: Optional[int] = None,
+                        channel_ids: Optional[List[str]] = None, group_title: str = None,
+                        batch_size: int = 500) -> Iterator[sqlite3.Row]:
+        """Stream programmes of active channels overlapping [start, stop), ordered by channel and time"""
+        conditions, params = self._guide_channel_conditions(channel_ids, group_title)
+        query = f'''
+            SELECT {", ".join(self.PROGRAMME_COLUMNS)} FROM programmes
+            WHERE channel_id IN (SELECT tvg_id FROM channels WHERE {" AND ".join(conditions)})
+        '''
+        if start is not None:
+            query += " AND stop > ?"
+            params.append(start)
+        if stop is not None:
+            query += " AND start < ?"
+            params.append(stop)
+        query += " ORDER BY channel_id, start"
+        return self._iter_rows(query, params, batch_size)
     
     def scan_directory(self, directory: str, content_type: str = "movies") -> List[Dict]:
         """Scan directory for media files and add to database"""
@@ -409,56 +1207,51 @@ class ContentManager:
     
     def clear_all_content(self):
         """Clear all content from the database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        conn = self._connect()
+        with conn:
+            cursor = conn.cursor()
+            
+            # Clear all tables
+            cursor.execute("DELETE FROM channels")
+            cursor.execute("DELETE FROM movies")
+            cursor.execute("DELETE FROM shows")
+            cursor.execute("DELETE FROM episodes")
+            cursor.execute("DELETE FROM categories")
+            
+            # Reset auto-increment counters
+            cursor.execute("DELETE FROM sqlite_sequence WHERE name IN ('channels', 'movies', 'shows', 'episodes', 'categories')")
         
-        # Clear all tables
-        cursor.execute("DELETE FROM channels")
-        cursor.execute("DELETE FROM movies")
-        cursor.execute("DELETE FROM shows")
-        cursor.execute("DELETE FROM episodes")
-        cursor.execute("DELETE FROM categories")
-        
-        # Reset auto-increment counters
-        cursor.execute("DELETE FROM sqlite_sequence WHERE name IN ('channels', 'movies', 'shows', 'episodes', 'categories')")
-        
-        conn.commit()
-        conn.close()
         print("✅ All content cleared from database")
 
     def get_statistics(self) -> Dict:
         """Get content statistics"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         stats = {}
         
-        # Count channels
-        cursor.execute("SELECT COUNT(*) FROM channels WHERE is_active = 1")
-        stats['total_channels'] = cursor.fetchone()[0]
-        
-        # Count movies (from channels table)
-        cursor.execute("SELECT COUNT(*) FROM channels WHERE url LIKE '%/movie/%' AND is_active = 1")
-        stats['total_movies'] = cursor.fetchone()[0]
+        # Counters are maintained by triggers, see _create_statistics
+        cursor.execute("SELECT scope, name, count, bytes FROM content_stats WHERE count > 0")
+        counters = {}
+        for scope, name, count, size in cursor.fetchall():
+            counters.setdefault(scope, {})[name] = (count, size)
         
-        # Count shows/series (from channels table)
-        cursor.execute("SELECT COUNT(*) FROM channels WHERE url LIKE '%/series/%' AND is_active = 1")
-        stats['total_shows'] = cursor.fetchone()[0]
+        type_counts = {name: count for name, (count, _) in counters.get('content_type', {}).items()}
+        stats['total_channels'] = sum(type_counts.values())
+        stats['total_movies'] = type_counts.get('movie', 0)
+        stats['total_shows'] = type_counts.get('series', 0)
+        stats['channels_by_category'] = {
+            name: count for name, (count, _) in sorted(counters.get('category', {}).items())
+        }
         
         # Count episodes
-        cursor.execute("SELECT COUNT(*) FROM episodes WHERE is_active = 1")
-        stats['total_episodes'] = cursor.fetchone()[0]
+        episode_count, episode_size = counters.get('episodes', {}).get('', (0, 0))
+        stats['total_episodes'] = episode_count
         
         # Total storage used
-        cursor.execute("SELECT SUM(file_size) FROM movies WHERE is_active = 1")
-        movie_size = cursor.fetchone()[0] or 0
-        
-        cursor.execute("SELECT SUM(file_size) FROM episodes WHERE is_active = 1")
-        episode_size = cursor.fetchone()[0] or 0
-        
+        _, movie_size = counters.get('movies', {}).get('', (0, 0))
         stats['total_storage_gb'] = round((movie_size + episode_size) / (1024**3), 2)
         
-        conn.close()
         return stats
 
 def main():
@@ -499,4 +1292,9 @@ def main():
     print(f"Storage: {stats['total_storage_gb']} GB")
 
 if __name__ == "__main__":
-    main()
+    if sys.argv[1:] == ["rebuild-stats"]:
+        with ContentManager() as manager:
+            manager.rebuild_statistics()
+        print("✅ Content statistics rebuilt")
+    else:
+        main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+IPTV EPG
+Stream-parses XMLTV guides into the programmes table and renders them back out
+"""
+
+import sys
+import gzip
+import json
+import time
+import argparse
+import calendar
+import urllib.request
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape, quoteattr
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, Mapping, Optional, Tuple
+from content_manager import ContentManager
+from playlist import CHUNK_SIZE, chunked
+
+CONFIG_PATH = Path(__file__).parent / "config.json"
+
+# Length given to a channel's last programme when the guide omits its stop time
+DEFAULT_PROGRAMME_SECONDS = 3600
+
+def parse_xmltv_time(value: Optional[str]) -> Optional[int]:
+    """Convert an XMLTV time such as '20240101183000 +0100' to a UTC unix timestamp"""
+    if not value:
+        return None
+    stamp, _, offset = value.strip().partition(" ")
+    digits = stamp[:14].ljust(14, "0")
+    if not digits.isdigit():
+        return None
+    # Sliced by hand: strptime dominates import time on large guides
+    seconds = calendar.timegm((int(digits[0:4]), int(digits[4:6]), int(digits[6:8]),
+                               int(digits[8:10]), int(digits[10:12]), int(digits[12:14]), 0, 0, 0))
+
+    offset = offset.strip()
+    if len(offset) == 5 and offset[0] in "+-" and offset[1:].isdigit():
+        delta = int(offset[1:3]) * 3600 + int(offset[3:5]) * 60
+        seconds = seconds - delta if offset[0] == "+" else seconds + delta
+    return seconds
+
+def xmltv_time(timestamp: int) -> str:
+    """Format a UTC unix timestamp as an XMLTV time"""
+    return time.strftime("%Y%m%d%H%M%S +0000", time.gmtime(timestamp))
+
+def render_channel(channel: Mapping) -> str:
+    """Render a <channel> element from a guide channel row"""
+    icon = f'    <icon src={quoteattr(channel["logo"])}/>\n' if channel["logo"] else ""
+    return (f'  <channel id={quoteattr(channel["tvg_id"])}>\n'
+            f'    <display-name>{escape(channel["name"] or "")}</display-name>\n'
+            f'{icon}'
+            f'  </channel>\n')
+
+def render_programme(programme: Mapping) -> str:
+    """Render a <programme> element, leaving out empty optional children"""
+    parts = [f'  <programme start="{xmltv_time(programme["start"])}" stop="{xmltv_time(programme["stop"])}"'
+             f' channel={quoteattr(programme["channel_id"])}>\n'
+             f'    <title>{escape(programme["title"] or "")}</title>\n']
+    for tag, column in (("sub-title", "sub_title"), ("desc", "description"),
+                        ("category", "category"), ("episode-num", "episode_num")):
+        if programme[column]:
+            parts.append(f'    <{tag}>{escape(programme[column])}</{tag}>\n')
+    if programme["icon"]:
+        parts.append(f'    <icon src={quoteattr(programme["icon"])}/>\n')
+    parts.append('  </programme>\n')
+    return "".join(parts)
+
+def render_epg(channels: Iterable[Mapping], programmes: Iterable[Mapping],
+               chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """Yield an XMLTV document in chunks from guide channel and programme rows"""
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE tv SYSTEM "xmltv.dtd">\n<tv>\n'
+    yield from chunked((render_channel(channel) for channel in channels), chunk_size)
+    yield from chunked((render_programme(programme) for programme in programmes), chunk_size)
+    yield '</tv>\n'
+
+def open_source(source: str) -> BinaryIO:
+    """Open a local XMLTV file or URL for streaming, transparently gunzipping .gz guides"""
+    if source.startswith(("http://", "https://")):
+        stream = urllib.request.urlopen(source, timeout=30)
+    else:
+        stream = open(source, "rb")
+    if source.endswith(".gz"):
+        return gzip.GzipFile(fileobj=stream)
+    return stream
+
+def _channel(elem: ET.Element) -> Dict:
+    icon = elem.find("icon")
+    return {
+        "id": elem.get("id"),
+        "display_name": elem.findtext("display-name", ""),
+        "icon": icon.get("src", "") if icon is not None else ""
+    }
+
+def _programme(elem: ET.Element) -> Dict:
+    icon = elem.find("icon")
+    return {
+        "channel_id": elem.get("channel"),
+        "start": parse_xmltv_time(elem.get("start")),
+        "stop": parse_xmltv_time(elem.get("stop")),
+        "title": elem.findtext("title", ""),
+        "sub_title": elem.findtext("sub-title", ""),
+        "description": elem.findtext("desc", ""),
+        "category": elem.findtext("category", ""),
+        "episode_num": elem.findtext("episode-num", ""),
+        "icon": icon.get("src", "") if icon is not None else ""
+    }
+
+def iter_xmltv(stream: BinaryIO) -> Iterator[Tuple[str, Dict]]:
+    """Yield ("channel", dict) and ("programme", dict) items from an XMLTV document
+
+    Each finished element is discarded from the tree, so memory stays
+    bounded however large the guide is. Programmes without a stop time end
+    where the channel's next programme starts.
+    """
+    context = ET.iterparse(stream, events=("start", "end"))
+    _, root = next(context)
+    open_ended: Dict[str, Dict] = {}
+
+    for event, elem in context:
+        if event != "end" or elem.tag not in ("channel", "programme"):
+            continue
+
+        if elem.tag == "channel":
+            if elem.get("id"):
+                yield "channel", _channel(elem)
+        else:
+            programme = _programme(elem)
+            channel_id = programme["channel_id"]
+            if channel_id and programme["start"] is not None:
+                previous = open_ended.pop(channel_id, None)
+                if previous:
+                    previous["stop"] = programme["start"]
+                    yield "programme", previous
+                if programme["stop"] is None:
+                    open_ended[channel_id] = programme
+                else:
+                    yield "programme", programme
+
+        # Children of <tv> are complete once they end; drop them from the tree
+        root.clear()
+
+    for programme in open_ended.values():
+        programme["stop"] = programme["start"] + DEFAULT_PROGRAMME_SECONDS
+        yield "programme", programme
+
+def import_xmltv(manager: ContentManager, source: str, batch_size: int = 1000,
+                 progress: Optional[Callable[[int], None]] = None) -> Dict[str, int]:
+    """Import one XMLTV guide, replacing only the time window it covers per channel"""
+    channels = []
+
+    def programmes():
+        with open_source(source) as stream:
+            for kind, item in iter_xmltv(stream):
+                if kind == "channel":
+                    channels.append(item)
+                else:
+                    yield item
+
+    count = manager.replace_programmes(programmes(), batch_size=batch_size, progress=progress)
+    manager.add_epg_channels(channels)
+    return {"channels": len(channels), "programmes": count}
+
+def load_epg_config() -> Dict:
+    """Read the epg section of config.json"""
+    try:
+        with open(CONFIG_PATH, "r") as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        config = {}
+    return config.get("epg", {})
+
+def main():
+    settings = load_epg_config()
+
+    parser = argparse.ArgumentParser(description="Import XMLTV guides into the programmes table")
+    parser.add_argument("sources", nargs="*", help="XMLTV files or URLs (default: epg.sources in config.json)")
+    parser.add_argument("--db", default="iptv_content.db", help="database path")
+    parser.add_argument("--batch-size", type=int, default=1000, help="programmes per insert batch")
+    parser.add_argument("--retention-days", type=float, default=settings.get("retention_days", 1),
+                        help="delete programmes that ended more than this many days ago")
+    args = parser.parse_args()
+
+    sources = args.sources or settings.get("sources", [])
+    if not sources:
+        parser.error("no XMLTV sources given and epg.sources is empty")
+
+    with ContentManager(args.db) as manager:
+        for source in sources:
+            print(f"📺 Importing guide: {source}")
+            start = time.perf_counter()
+
+            def report_progress(total):
+                if total % 50000 == 0:
+                    print(f"   {total} programmes read...")
+
+            try:
+                counts = import_xmltv(manager, source, args.batch_size, report_progress)
+            except (OSError, ET.ParseError) as e:
+                print(f"❌ Failed to import {source}: {e}")
+                continue
+            print(f"✅ {counts['programmes']} programmes for {counts['channels']} channels "
+                  f"in {time.perf_counter() - start:.1f}s")
+
+        pruned = manager.prune_programmes(int(time.time() - args.retention_days * 86400))
+        print(f"🧹 Pruned {pruned} finished programmes")
+
+if __name__ == "__main__":
+    sys.exit(main())
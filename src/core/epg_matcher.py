@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+IPTV EPG Matcher
+Assigns guide ids to channels by fuzzy name matching over a character n-gram index
+"""
+
+import re
+import sys
+import time
+import heapq
+import argparse
+import unicodedata
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+from content_manager import ContentManager
+from epg import load_epg_config
+
+# Quality, codec and feed tags that providers append to channel names
+QUALITY_TAGS = re.compile(
+    r"\b(?:uhd|fhd|hd|sd|hq|lq|4k|8k|hevc|h\.?26[45]|\d{3,4}[pi]|\d{2}fps|raw|backup|vip|multi)\b"
+)
+# Leading country markers such as "US:", "|UK|", "[DE]" or "(FR)"
+COUNTRY_PREFIX = re.compile(r"^\W*[a-z]{2,3}\s*[:|\])]\s*")
+BRACKETED = re.compile(r"[\[(][^\])]*[\])]")
+# Trailing country segment of XMLTV ids such as "bbcone.uk"
+ID_COUNTRY_SUFFIX = re.compile(r"\.[a-z]{2}$")
+NON_ALNUM = re.compile(r"[^a-z0-9+]")
+
+NGRAM_SIZE = 3
+# Candidates scored exactly per lookup after n-gram voting
+CANDIDATES = 20
+# Posting lists longer than this are skipped once rarer grams produced candidates
+MAX_POSTINGS = 500
+
+def normalize_name(name: str) -> str:
+    """Reduce a channel or guide name to a compact comparable key ("US: CNN HD" -> "cnn")"""
+    text = unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode().lower()
+    text = COUNTRY_PREFIX.sub("", text)
+    text = BRACKETED.sub(" ", text)
+    text = QUALITY_TAGS.sub(" ", text.replace("&", " and "))
+    return NON_ALNUM.sub("", text)
+
+def id_name(epg_id: str) -> str:
+    """Derive a matchable name from an XMLTV channel id ("bbcone.uk" -> "bbcone")"""
+    return ID_COUNTRY_SUFFIX.sub("", (epg_id or "").lower())
+
+def ngrams(key: str) -> FrozenSet[str]:
+    """Character n-grams of a key, padded so word boundaries count"""
+    padded = f"^{key}$"
+    return frozenset(padded[i:i + NGRAM_SIZE] for i in range(max(1, len(padded) - NGRAM_SIZE + 1)))
+
+class EpgMatcher:
+    """Finds the guide channel whose name best matches a channel name
+
+    Exact normalized names resolve through a dict. Other names vote for
+    candidates through an inverted n-gram index, rarest grams first, and
+    only the top candidates get an exact Dice similarity.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, str]]):
+        self.ids: List[str] = []
+        self.grams: List[FrozenSet[str]] = []
+        self.exact: Dict[str, str] = {}
+        self.postings: Dict[str, List[int]] = {}
+        self._cache: Dict[str, Tuple[Optional[str], float]] = {}
+
+        for epg_id, display_name in entries:
+            for key in {normalize_name(display_name), normalize_name(id_name(epg_id))}:
+                if not key:
+                    continue
+                self.exact.setdefault(key, epg_id)
+                grams = ngrams(key)
+                for gram in grams:
+                    self.postings.setdefault(gram, []).append(len(self.ids))
+                self.ids.append(epg_id)
+                self.grams.append(grams)
+
+    def match(self, name: str) -> Tuple[Optional[str], float]:
+        """Return (epg id, score in 0..1) of the best match, or (None, 0.0)"""
+        key = normalize_name(name)
+        if key not in self._cache:
+            self._cache[key] = self._match(key)
+        return self._cache[key]
+
+    def _match(self, key: str) -> Tuple[Optional[str], float]:
+        if not key:
+            return None, 0.0
+        if key in self.exact:
+            return self.exact[key], 1.0
+
+        grams = ngrams(key)
+        votes: Dict[int, int] = {}
+        for gram in sorted(grams, key=lambda g: len(self.postings.get(g, ()))):
+            postings = self.postings.get(gram)
+            if not postings:
+                continue
+            if len(postings) > MAX_POSTINGS and votes:
+                break
+            for entry in postings:
+                votes[entry] = votes.get(entry, 0) + 1
+
+        best_id, best_score = None, 0.0
+        for entry in heapq.nlargest(CANDIDATES, votes, key=votes.get):
+            score = 2 * len(grams & self.grams[entry]) / (len(grams) + len(self.grams[entry]))
+            if score > best_score:
+                best_id, best_score = self.ids[entry], score
+        return best_id, best_score
+
+def match_channels(manager: ContentManager, incremental: bool = False,
+                   threshold: float = 0.6) -> Dict[str, int]:
+    """Match channels against the imported guide channels and store the results
+
+    Matches scoring below threshold are recorded (so incremental runs skip
+    them until the channel is renamed) but leave tvg_id untouched.
+    """
+    matcher = EpgMatcher(manager.get_epg_channels())
+    counts = {"checked": 0, "matched": 0}
+
+    def results():
+        for channel in manager.iter_unmatched_channels(incremental=incremental):
+            epg_id, score = matcher.match(channel["name"])
+            counts["checked"] += 1
+            if epg_id and score >= threshold:
+                counts["matched"] += 1
+                yield channel["id"], epg_id, round(score, 3), channel["name"]
+            else:
+                yield channel["id"], None, round(score, 3), channel["name"]
+
+    manager.set_tvg_matches(results())
+    return counts
+
+def main():
+    settings = load_epg_config()
+
+    parser = argparse.ArgumentParser(description="Match channels to guide ids by name")
+    parser.add_argument("--db", default="iptv_content.db", help="database path")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only match channels that are new or renamed since the last run")
+    parser.add_argument("--threshold", type=float, default=settings.get("match_threshold", 0.6),
+                        help="minimum similarity (0-1) for assigning a tvg_id")
+    args = parser.parse_args()
+
+    with ContentManager(args.db) as manager:
+        if not manager.get_epg_channels():
+            print("❌ No guide channels imported yet, run epg.py first")
+            return 1
+
+        print(f"🔍 Matching channels to guide ids{' (incremental)' if args.incremental else ''}...")
+        start = time.perf_counter()
+        counts = match_channels(manager, args.incremental, args.threshold)
+        print(f"✅ Matched {counts['matched']} of {counts['checked']} channels "
+              f"in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    sys.exit(main())
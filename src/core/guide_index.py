@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+IPTV Guide Index
+In-memory per-channel programme intervals for fast now/next lookups
+"""
+
+import time
+import asyncio
+import logging
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+from content_manager import ContentManager
+
+logger = logging.getLogger(__name__)
+
+class GuideIndex:
+    """Sorted programme intervals per guide channel, covering the next few hours
+
+    Each channel keeps its programme start times in a sorted list next to
+    the programmes themselves, so a lookup is one bisect. The index tracks
+    the catalog version it was built from: guide imports only reload the
+    channels they touched, and the whole window is reloaded once time
+    runs close to its end.
+    """
+
+    def __init__(self, manager: ContentManager, horizon_hours: float = 24):
+        self.manager = manager
+        self.horizon = int(horizon_hours * 3600)
+        self.version: Optional[int] = None
+        self.loaded_from = 0
+        self.loaded_until = 0
+        self._channels: Dict[str, Tuple[List[int], List[Dict]]] = {}
+        self._lock = asyncio.Lock()
+
+    async def ensure_current(self):
+        """Bring the index up to date with the catalog before a lookup"""
+        async with self._lock:
+            version, _ = await asyncio.to_thread(self.manager.get_catalog_version)
+            now = int(time.time())
+            if self.version is None or now + self.horizon // 2 > self.loaded_until:
+                await asyncio.to_thread(self._load_all, version, now)
+            elif version != self.version:
+                await asyncio.to_thread(self._load_changed, version)
+
+    def _load(self, channel_ids: Optional[List[str]] = None) -> Dict[str, Tuple[List[int], List[Dict]]]:
+        channels: Dict[str, Tuple[List[int], List[Dict]]] = {}
+        # Rows arrive ordered by channel and start, so every list is built already sorted
+        for row in self.manager.iter_programmes(start=self.loaded_from, stop=self.loaded_until,
+                                                channel_ids=channel_ids, batch_size=2000):
+            starts, programmes = channels.setdefault(row["channel_id"], ([], []))
+            starts.append(row["start"])
+            programmes.append(dict(row))
+        return channels
+
+    def _load_all(self, version: int, now: int):
+        started = time.perf_counter()
+        self.loaded_from = now
+        self.loaded_until = now + self.horizon
+        self._channels = self._load()
+        self.version = version
+        logger.info(f"Guide index loaded {len(self._channels)} channels "
+                    f"in {time.perf_counter() - started:.2f}s")
+
+    def _load_changed(self, version: int):
+        changed = self.manager.get_guide_updates(since=self.version)
+        if changed:
+            reloaded = self._load(changed)
+            for channel_id in changed:
+                if channel_id in reloaded:
+                    self._channels[channel_id] = reloaded[channel_id]
+                else:
+                    self._channels.pop(channel_id, None)
+        self.version = version
+
+    def now(self, channel_ids: List[str], at: Optional[int] = None) -> Dict[str, Optional[Dict]]:
+        """Return the programme airing at `at` (default: now) for each channel, or None"""
+        at = int(time.time()) if at is None else at
+        result = {}
+        for channel_id in channel_ids:
+            starts, programmes = self._channels.get(channel_id, ((), ()))
+            i = bisect_right(starts, at) - 1
+            result[channel_id] = programmes[i] if i >= 0 and programmes[i]["stop"] > at else None
+        return result
+
+    def next(self, channel_ids: List[str], count: int = 1, at: Optional[int] = None) -> Dict[str, List[Dict]]:
+        """Return up to count programmes starting after `at` (default: now) for each channel"""
+        at = int(time.time()) if at is None else at
+        result = {}
+        for channel_id in channel_ids:
+            starts, programmes = self._channels.get(channel_id, ((), ()))
+            i = bisect_right(starts, at)
+            result[channel_id] = programmes[i:i + count]
+        return result
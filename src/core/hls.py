@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+IPTV HLS Proxy
+Rewrites HLS playlists to point at this server and caches their segments
+"""
+
+import os
+import re
+import hmac
+import time
+import base64
+import asyncio
+import hashlib
+import logging
+import secrets
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+import requests
+from coalescing import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# (connect, read) timeouts for upstream providers
+UPSTREAM_TIMEOUT = (5, 20)
+
+PLAYLIST_MEDIA_TYPE = "application/vnd.apple.mpegurl"
+SEGMENT_MEDIA_TYPES = {
+    ".ts": "video/mp2t",
+    ".aac": "audio/aac",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+    ".vtt": "text/vtt"
+}
+
+URI_ATTRIBUTE = re.compile(r'URI="([^"]*)"')
+
+# Segment successors remembered for prefetching (live playlists roll over constantly)
+NEXT_SEGMENT_LIMIT = 4096
+# Recently fetched playlists kept for reuse within playlist_ttl
+PLAYLIST_LIMIT = 1024
+
+Fetcher = Callable[[str], Tuple[str, bytes]]
+
+def http_fetch(url: str) -> Tuple[str, bytes]:
+    """Download an upstream resource; returns (final url after redirects, body)"""
+    response = requests.get(url, timeout=UPSTREAM_TIMEOUT)
+    response.raise_for_status()
+    return response.url, response.content
+
+def is_playlist(url: str) -> bool:
+    return urlsplit(url).path.lower().endswith((".m3u8", ".m3u"))
+
+class SegmentCache:
+    """Size-bounded LRU of segment bodies in memory, spilling evicted entries to disk
+
+    Entries pushed out of memory move to the disk tier, which has its own
+    LRU bound; a disk hit is promoted back into memory. The indexes are
+    only touched from the event loop, while file reads, writes and deletes
+    run on the cache's own I/O thread. That thread works through them in
+    order, so a read always sees the spill queued before it.
+    """
+
+    def __init__(self, memory_bytes: int, disk_bytes: int, directory: Path):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.directory = Path(directory)
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_size = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_size = 0
+        self._disk_io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="hls-disk")
+        self._disk_io.submit(self._clear_directory)
+        self.hits = 0
+        self.misses = 0
+
+    def _clear_directory(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for stale in self.directory.glob("*.seg"):
+            stale.unlink(missing_ok=True)
+
+    def _path(self, url: str) -> Path:
+        return self.directory / (hashlib.sha1(url.encode()).hexdigest() + ".seg")
+
+    def __contains__(self, url: str) -> bool:
+        return url in self._memory or url in self._disk
+
+    async def get(self, url: str) -> Optional[bytes]:
+        data = self._memory.get(url)
+        if data is not None:
+            self._memory.move_to_end(url)
+            self.hits += 1
+            return data
+
+        if url in self._disk:
+            path = self._path(url)
+            self._drop_from_disk(url, unlink=False)
+            data = await asyncio.get_running_loop().run_in_executor(self._disk_io, self._read, path)
+            if data is not None:
+                self.hits += 1
+                self.put(url, data)
+                return data
+
+        self.misses += 1
+        return None
+
+    def put(self, url: str, data: bytes):
+        if url in self._memory:
+            return
+        self._memory[url] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes and len(self._memory) > 1:
+            old_url, old_data = self._memory.popitem(last=False)
+            self._memory_size -= len(old_data)
+            self._spill(old_url, old_data)
+
+    def _spill(self, url: str, data: bytes):
+        if len(data) > self.disk_bytes or url in self._disk:
+            return
+        self._disk[url] = len(data)
+        self._disk_size += len(data)
+        self._disk_io.submit(self._write, self._path(url), data)
+        while self._disk_size > self.disk_bytes:
+            self._drop_from_disk(next(iter(self._disk)))
+
+    def _drop_from_disk(self, url: str, unlink: bool = True):
+        size = self._disk.pop(url, None)
+        if size is not None:
+            self._disk_size -= size
+            if unlink:
+                self._disk_io.submit(self._path(url).unlink, missing_ok=True)
+
+    @staticmethod
+    def _read(path: Path) -> Optional[bytes]:
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        path.unlink(missing_ok=True)
+        return data
+
+    @staticmethod
+    def _write(path: Path, data: bytes):
+        try:
+            path.write_bytes(data)
+        except OSError as e:
+            # The entry stays indexed; reading it back misses and drops it
+            logger.warning(f"Could not spill segment to disk: {e}")
+
+    def close(self):
+        """Stop the I/O thread, abandoning queued spills (the directory is cleared on startup)"""
+        self._disk_io.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict:
+        return {
+            "memory_segments": len(self._memory),
+            "memory_bytes": self._memory_size,
+            "disk_segments": len(self._disk),
+            "disk_bytes": self._disk_size,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+class HlsProxy:
+    """Serves rewritten HLS playlists and cached segments for channels
+
+    Upstream URLs are carried in signed path tokens, so the proxy only
+    fetches URLs that appeared in a playlist it rewrote itself. Concurrent
+    requests for the same playlist or segment share one upstream fetch.
+    """
+
+    def __init__(self, cache: SegmentCache, fetch: Fetcher = http_fetch, playlist_ttl: float = 1.0,
+                 fetch_limit: int = 32, secret: Optional[bytes] = None):
+        self.cache = cache
+        self.fetch = fetch
+        self.playlist_ttl = playlist_ttl
+        self.secret = secret or secrets.token_bytes(32)
+        self._flight = SingleFlight("hls", fetch_limit)
+        self._playlists: "OrderedDict[str, Tuple[float, str, str]]" = OrderedDict()
+        self._next_segment: "OrderedDict[str, str]" = OrderedDict()
+        self._prefetching: Dict[str, asyncio.Task] = {}
+
+    def sign(self, url: str) -> str:
+        """Encode an upstream URL as a signed path token"""
+        encoded = base64.urlsafe_b64encode(url.encode()).decode().rstrip("=")
+        signature = hmac.new(self.secret, url.encode(), hashlib.sha256).hexdigest()[:16]
+        return f"{encoded}.{signature}"
+
+    def unsign(self, token: str) -> Optional[str]:
+        """Decode a token produced by sign(); None if it was tampered with"""
+        encoded, _, signature = token.partition(".")
+        signature = signature.split(".")[0]
+        try:
+            url = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4)).decode()
+        except (ValueError, UnicodeDecodeError):
+            return None
+        expected = hmac.new(self.secret, url.encode(), hashlib.sha256).hexdigest()[:16]
+        return url if hmac.compare_digest(signature, expected) else None
+
+    def local_uri(self, channel_id: int, url: str) -> str:
+        """Server path that proxies an upstream playlist or segment URL"""
+        if is_playlist(url):
+            return f"/hls/{channel_id}/playlist/{self.sign(url)}.m3u8"
+        extension = os.path.splitext(urlsplit(url).path)[1].lower()[:5]
+        return f"/hls/{channel_id}/segment/{self.sign(url)}{extension}"
+
+    def rewrite_playlist(self, channel_id: int, text: str, base_url: str) -> str:
+        """Point every URI of a playlist at this server and remember segment order for prefetching"""
+        lines = []
+        previous_segment = None
+        for line in text.splitlines():
+            stripped = line.strip()
+            if not stripped:
+                lines.append(line)
+            elif stripped.startswith("#"):
+                lines.append(URI_ATTRIBUTE.sub(
+                    lambda match: f'URI="{self.local_uri(channel_id, urljoin(base_url, match.group(1)))}"', line))
+            else:
+                url = urljoin(base_url, stripped)
+                if not is_playlist(url):
+                    if previous_segment:
+                        self._next_segment[previous_segment] = url
+                        if len(self._next_segment) > NEXT_SEGMENT_LIMIT:
+                            self._next_segment.popitem(last=False)
+                    previous_segment = url
+                lines.append(self.local_uri(channel_id, url))
+        return "\n".join(lines) + "\n"
+
+    async def playlist(self, channel_id: int, url: str) -> str:
+        """Fetch (or reuse a just-fetched copy of) a playlist and rewrite it"""
+        cached = self._playlists.get(url)
+        if cached is None or time.monotonic() - cached[0] > self.playlist_ttl:
+            final_url, body = await self._flight.run(("playlist", url), self.fetch, url)
+            cached = (time.monotonic(), final_url, body.decode("utf-8", "replace"))
+            self._playlists[url] = cached
+            self._playlists.move_to_end(url)
+            if len(self._playlists) > PLAYLIST_LIMIT:
+                self._playlists.popitem(last=False)
+        _, final_url, text = cached
+        return self.rewrite_playlist(channel_id, text, final_url)
+
+    async def segment(self, url: str) -> bytes:
+        """Return a segment from the cache or upstream, then prefetch the one after it"""
+        data = await self.cache.get(url)
+        if data is None:
+            data = await self._download(url)
+
+        following = self._next_segment.get(url)
+        if following and following not in self.cache and following not in self._prefetching:
+            self._prefetching[following] = asyncio.get_running_loop().create_task(self._prefetch(following))
+        return data
+
+    async def _download(self, url: str) -> bytes:
+        _, data = await self._flight.run(("segment", url), self.fetch, url)
+        self.cache.put(url, data)
+        return data
+
+    async def _prefetch(self, url: str):
+        try:
+            await self._download(url)
+        except Exception as e:
+            logger.debug(f"Prefetch of {url} failed: {e}")
+        finally:
+            self._prefetching.pop(url, None)
+
+    def stats(self) -> Dict:
+        return {**self.cache.stats(), "playlists": len(self._playlists), "prefetching": len(self._prefetching)}
+
+    def close(self):
+        """Cancel pending prefetches and stop the segment cache's I/O thread"""
+        for task in list(self._prefetching.values()):
+            task.cancel()
+        self.cache.close()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+IPTV M3U Parser
+Streaming #EXTM3U parser shared by the server, the importers and the HDHomeRun tools
+"""
+
+import re
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Union
+
+# key="quoted value" (may hold spaces and commas) or key=bare-value; the lookbehind
+# picks the quoted form once an opening quote was consumed, so values need no unquoting
+ATTRIBUTE = re.compile(r'([\w-]+)="?((?<=")[^"]*|[^\s",]*)')
+# Everything up to the first comma outside quotes, then the title
+EXTINF = re.compile(r'([^,"]*(?:"[^"]*"[^,"]*)*),?(.*)')
+
+class M3UEntry:
+    """One playlist entry: the #EXTINF fields, its #EXTGRP/#EXTVLCOPT lines and the stream URL"""
+
+    __slots__ = ("name", "url", "duration", "attrs", "group", "options")
+
+    def __init__(self, name: str, url: str, duration: float, attrs: Dict[str, str],
+                 group: Optional[str] = None, options: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.url = url
+        self.duration = duration
+        self.attrs = attrs
+        self.group = group
+        self.options = options
+
+    @property
+    def tvg_id(self) -> str:
+        return self.attrs.get("tvg-id", "")
+
+    @property
+    def tvg_name(self) -> str:
+        return self.attrs.get("tvg-name", "")
+
+    @property
+    def logo(self) -> str:
+        return self.attrs.get("tvg-logo", "")
+
+    @property
+    def group_title(self) -> str:
+        """group-title, falling back to an #EXTGRP line"""
+        return self.attrs.get("group-title") or self.group or ""
+
+    def __repr__(self) -> str:
+        return f"M3UEntry({self.name!r}, {self.url!r})"
+
+def parse_extinf(info: str) -> Tuple[float, Dict[str, str], str]:
+    """Split the text after "#EXTINF:" into (duration, attributes, title)
+
+    The title starts at the first comma outside a quoted attribute value,
+    so group-title="News, Sports" stays whole.
+    """
+    header, title = EXTINF.match(info).groups()
+    if info[len(header):len(header) + 1] == '"':
+        # Unbalanced quote: fall back to the last comma
+        header, _, title = info.rpartition(",")
+    try:
+        duration = float(header.partition(" ")[0])
+    except ValueError:
+        duration = -1.0
+    return duration, dict(ATTRIBUTE.findall(header)), title.strip()
+
+def parse_m3u(lines: Iterable[Union[str, bytes]]) -> Iterator[M3UEntry]:
+    """Parse playlist lines from any source (file, HTTP stream, socket) as they arrive
+
+    Bytes lines are decoded as UTF-8. #EXTGRP and #EXTVLCOPT lines belong
+    to the entry whose URL follows them; URLs without an #EXTINF header
+    and other comment lines are skipped.
+    """
+    header = None
+    group = None
+    options = None
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", "replace")
+        line = line.strip().lstrip("\ufeff")
+        if not line:
+            continue
+
+        if line[0] == "#":
+            if line.startswith("#EXTINF:"):
+                header = parse_extinf(line[8:])
+            elif line.startswith("#EXTGRP:"):
+                group = line[8:].strip()
+            elif line.startswith("#EXTVLCOPT:"):
+                key, _, value = line[11:].partition("=")
+                if options is None:
+                    options = {}
+                options[key.strip()] = value.strip()
+            continue
+
+        if header is not None:
+            duration, attrs, name = header
+            yield M3UEntry(name, line, duration, attrs, group, options)
+        header = group = options = None
+
+def parse_m3u_text(text: str) -> Iterator[M3UEntry]:
+    """Parse a playlist held in memory"""
+    return parse_m3u(text.splitlines())
+
+def parse_m3u_file(path: str) -> Iterator[M3UEntry]:
+    """Parse a playlist file line by line without reading it whole"""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        yield from parse_m3u(f)
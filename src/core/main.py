@@ -5,30 +5,235 @@ Supports 2000+ TV channels and 20,000+ movies/shows
 """
 
 import os
+import base64
+import hashlib
 import asyncio
 import logging
+from contextlib import asynccontextmanager
+from itertools import chain
 from pathlib import Path
-from typing import List, Dict, Optional
-from fastapi import FastAPI, HTTPException, Request, BackgroundTasks
+from typing import List, Dict, Optional, Tuple, Iterator, Callable
+from fastapi import FastAPI, HTTPException, Request, BackgroundTasks, Depends, Query
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, StreamingResponse, FileResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, FileResponse, Response, JSONResponse
 import uvicorn
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 import json
+from content_manager import ContentManager
+from playlist import PLAYLIST_FIELDS, render_playlist
+from m3u import parse_m3u_file
+from epg import render_epg
+from guide_index import GuideIndex
+from relay import StreamRelay, UpstreamError
+from media import RangeFileResponse
+from hls import PLAYLIST_MEDIA_TYPE as HLS_MEDIA_TYPE, SEGMENT_MEDIA_TYPES, HlsProxy, SegmentCache
+from artifacts import ArtifactCache, RenderedArtifact
+from compression import (available_encodings, choose_encoding, compress_chunks,
+                         compression_levels, read_ahead, representation_etag)
+from coalescing import Overloaded, build_flights
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+BASE_DIR = Path(__file__).parent
+CONFIG_PATH = BASE_DIR / "config.json"
+
+def load_config() -> Dict:
+    """Load server configuration, falling back to defaults if missing"""
+    try:
+        with open(CONFIG_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+config = load_config()
+
+# On-the-fly compression for dynamic responses
+COMPRESSION_MIN_SIZE = config.get("compression", {}).get("min_size", 1024)
+COMPRESSION_LEVELS = compression_levels(config.get("compression", {}))
+
+# Concurrent distinct computations allowed per endpoint before answering 503
+CONCURRENCY_LIMITS = {
+    "dashboard": 2,
+    "channels_page": 2,
+    "channels": 4,
+    "search": 8,
+    "movies": 4,
+    "shows": 4,
+    "stats": 2,
+    "playlist": 4,
+    "epg": 2
+}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build the shared ContentManager once; schema setup runs here, not per request"""
+    db_path = config.get("database", {}).get("path", "iptv_content.db")
+    manager = ContentManager(db_path)
+    app.state.content_manager = manager
+    app.state.flights = build_flights(config.get("concurrency", {}), CONCURRENCY_LIMITS)
+    
+    # Pre-render the full playlist and guide; later catalog changes re-render them lazily
+    app.state.playlist_cache = ArtifactCache(
+        "playlist", ".m3u",
+        lambda: render_playlist(manager.iter_channels(fields=PLAYLIST_FIELDS)),
+        PLAYLISTS_DIR,
+        encodings=available_encodings()
+    )
+    app.state.epg_cache = ArtifactCache(
+        "epg", ".xml",
+        lambda: render_epg(manager.iter_guide_channels(), manager.iter_programmes()),
+        EPG_DIR,
+        encodings=available_encodings()
+    )
+    for cache in (app.state.playlist_cache, app.state.epg_cache):
+        cache.refresh(*manager.get_catalog_version())
+    app.state.guide_index = GuideIndex(manager, config.get("epg", {}).get("index_hours", 24))
+    relay_settings = config.get("relay", {})
+    app.state.relay = StreamRelay(
+        buffer_chunks=relay_settings.get("buffer_chunks", 64),
+        start_chunks=relay_settings.get("start_chunks", 4),
+        idle_grace=relay_settings.get("idle_grace", 10),
+        connect_timeout=relay_settings.get("connect_timeout", 10)
+    )
+    hls_settings = config.get("hls", {})
+    app.state.hls = HlsProxy(
+        SegmentCache(
+            memory_bytes=hls_settings.get("memory_mb", 256) * 1024 * 1024,
+            disk_bytes=hls_settings.get("disk_mb", 2048) * 1024 * 1024,
+            directory=BASE_DIR / hls_settings.get("cache_dir", "hls_cache")
+        ),
+        playlist_ttl=hls_settings.get("playlist_ttl", 1.0)
+    )
+    try:
+        yield
+    finally:
+        for cache in (app.state.playlist_cache, app.state.epg_cache):
+            await cache.close()
+        app.state.relay.close()
+        app.state.hls.close()
+        manager.close()
+
+def get_content_manager(request: Request) -> ContentManager:
+    """Dependency returning the application-scoped ContentManager"""
+    return request.app.state.content_manager
+
+async def coalesce(request: Request, endpoint: str, func: Callable, **kwargs):
+    """Run a blocking catalog read once for all concurrent identical requests
+    
+    The catalog version is part of the key, so a request that arrives after
+    a write never shares a computation started before it.
+    """
+    version, _ = await asyncio.to_thread(request.app.state.content_manager.get_catalog_version)
+    key = (version, json.dumps(kwargs, sort_keys=True, default=str))
+    return await request.app.state.flights[endpoint].run(key, lambda: func(**kwargs))
+
+def http_date(timestamp: str) -> str:
+    """Format a SQLite UTC timestamp as an HTTP date"""
+    moment = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    return format_datetime(moment, usegmt=True)
+
+def catalog_etag(name: str, version: int, filters: Optional[Dict] = None) -> str:
+    """Strong ETag for a document rendered from a catalog version and query filters"""
+    tag = f"{name}-v{version}"
+    if filters:
+        tag += "-" + hashlib.md5(json.dumps(filters, sort_keys=True).encode()).hexdigest()[:12]
+    return f'"{tag}"'
+
+def is_not_modified(request: Request, etag: str, last_modified: str) -> bool:
+    """Evaluate If-None-Match (preferred) or If-Modified-Since against a representation"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def negotiate_encoding(request: Request, available) -> Optional[str]:
+    """Choose the response content-coding from the request's Accept-Encoding"""
+    return choose_encoding(request.headers.get("accept-encoding"), available)
+
+async def encoded_stream_response(chunks: Iterator[str], encoding: Optional[str],
+                                  media_type: str, headers: Dict) -> Response:
+    """Stream text chunks, compressing on the fly when an encoding was negotiated
+    
+    Bodies that end below the configured minimum size are sent uncompressed.
+    """
+    if encoding is None:
+        return StreamingResponse(chunks, media_type=media_type, headers=headers)
+    
+    # Peek far enough to know whether compression is worth it (blocking reads, so off the loop)
+    head, exhausted = await asyncio.to_thread(read_ahead, chunks, COMPRESSION_MIN_SIZE)
+    if exhausted and sum(len(chunk) for chunk in head) < COMPRESSION_MIN_SIZE:
+        return Response("".join(head), media_type=media_type, headers=headers)
+    
+    headers["Content-Encoding"] = encoding
+    return StreamingResponse(
+        compress_chunks(chain(head, chunks), encoding, COMPRESSION_LEVELS[encoding]),
+        media_type=media_type,
+        headers=headers
+    )
+
+def artifact_response(request: Request, artifact: RenderedArtifact, media_type: str, headers: Dict) -> Response:
+    """Serve a rendered artifact, picking the precompressed variant the client prefers"""
+    encoding = negotiate_encoding(request, artifact.variants)
+    headers["ETag"] = representation_etag(artifact.etag, encoding)
+    headers["Last-Modified"] = http_date(artifact.updated_at)
+    if is_not_modified(request, headers["ETag"], headers["Last-Modified"]):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        return FileResponse(artifact.variants[encoding], media_type=media_type, headers=headers)
+    return FileResponse(artifact.path, media_type=media_type, headers=headers)
+
+# Page sizes for the paginated catalog APIs
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+def encode_cursor(sort_value: str, row_id: int) -> str:
+    """Encode the (sort value, id) of a page's last row as an opaque cursor"""
+    return base64.urlsafe_b64encode(json.dumps([sort_value, row_id]).encode()).decode()
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[str, int]]:
+    """Decode a cursor produced by encode_cursor"""
+    if not cursor:
+        return None
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return sort_value, int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Split a comma separated fields= projection"""
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(",") if field.strip()]
+
+def page_response(key: str, rows: List[Dict], sort_column: str, limit: int) -> Dict:
+    """Wrap a page of rows with the cursor for the following page"""
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = encode_cursor(rows[-1][sort_column], rows[-1]["id"])
+    return {key: rows, "next_cursor": next_cursor}
+
 app = FastAPI(
     title="IPTV Server",
     description="A comprehensive IPTV streaming server with 2000+ channels and 20,000+ movies/shows",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Create necessary directories
-BASE_DIR = Path(__file__).parent
 MEDIA_DIR = BASE_DIR / "media"
 CHANNELS_DIR = MEDIA_DIR / "channels"
 MOVIES_DIR = MEDIA_DIR / "movies"
@@ -41,6 +246,15 @@ TEMPLATES_DIR = BASE_DIR / "templates"
 for directory in [MEDIA_DIR, CHANNELS_DIR, MOVIES_DIR, SHOWS_DIR, PLAYLISTS_DIR, EPG_DIR, STATIC_DIR, TEMPLATES_DIR]:
     directory.mkdir(exist_ok=True)
 
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    """Shed load with 503 and a Retry-After hint when an endpoint is at its limit"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 # Mount static files
 app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
 
@@ -92,13 +306,10 @@ class Show:
         self.id = len(shows_db) + 1
 
 @app.get("/channels", response_class=HTMLResponse)
-async def channels_page(request: Request):
+async def channels_page(request: Request, manager: ContentManager = Depends(get_content_manager)):
     """Channels page showing all channels"""
-    from content_manager import ContentManager
-    manager = ContentManager()
-    
     # Get all channels
-    channels = manager.get_channels()
+    channels = await coalesce(request, "channels_page", manager.get_channels)
     
     return templates.TemplateResponse("channels.html", {
         "request": request,
@@ -147,212 +358,352 @@ async def get_embed_code():
     return {"embed_code": embed_code, "iframe_url": "http://localhost:8000/embed"}
 
 @app.get("/", response_class=HTMLResponse)
-async def dashboard(request: Request):
+async def dashboard(request: Request, manager: ContentManager = Depends(get_content_manager)):
     """Main dashboard"""
-    from content_manager import ContentManager
-    manager = ContentManager()
-    
-    # Get statistics from database
-    stats = manager.get_statistics()
-    
-    # Get recent content
-    channels = manager.get_channels()[:20]  # Show more channels on dashboard
-    movies = manager.get_movies()[:10]
-    shows = manager.get_shows()[:10]
+    content = await coalesce(request, "dashboard", lambda: load_dashboard(manager))
     
-    return templates.TemplateResponse("dashboard.html", {
-        "request": request,
-        "stats": stats,
-        "channels": channels,
-        "movies": movies,
-        "shows": shows
-    })
+    return templates.TemplateResponse("dashboard.html", {"request": request, **content})
+
+def load_dashboard(manager: ContentManager) -> Dict:
+    """Collect everything the dashboard renders"""
+    return {
+        # Get statistics from database
+        "stats": manager.get_statistics(),
+        # Get recent content
+        "channels": manager.get_channels(limit=20),  # Show more channels on dashboard
+        "movies": manager.get_movies(limit=10),
+        "shows": manager.get_shows(limit=10)
+    }
 
 @app.get("/api/channels")
-async def get_channels():
-    """Get all channels"""
-    from content_manager import ContentManager
-    manager = ContentManager()
-    channels = manager.get_channels()
-    return {"channels": channels}
+async def get_channels(request: Request, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                       cursor: Optional[str] = None, fields: Optional[str] = None,
+                       category: Optional[str] = None, group: Optional[str] = None,
+                       content_type: Optional[str] = None,
+                       manager: ContentManager = Depends(get_content_manager)):
+    """Get a page of channels ordered by name; pass next_cursor back as cursor= for the next page"""
+    after = decode_cursor(cursor)
+    try:
+        channels = await coalesce(request, "channels", manager.get_channels,
+                                  category=category, content_type=content_type, group_title=group,
+                                  fields=parse_fields(fields), limit=limit, after=after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return page_response("channels", channels, "name", limit)
+
+@app.get("/api/search")
+async def search_channels(request: Request, q: str = Query(..., min_length=1), limit: int = Query(50, ge=1, le=500),
+                          category: Optional[str] = None, content_type: Optional[str] = None,
+                          fields: Optional[str] = None,
+                          manager: ContentManager = Depends(get_content_manager)):
+    """Ranked prefix search over channel names and groups"""
+    try:
+        channels = await coalesce(request, "search", manager.search_channels,
+                                  query=q, limit=limit, category=category,
+                                  content_type=content_type, fields=parse_fields(fields))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"query": q, "channels": channels}
 
 @app.get("/api/movies")
-async def get_movies():
-    """Get all movies"""
-    from content_manager import ContentManager
-    manager = ContentManager()
-    movies = manager.get_movies()
-    return {"movies": movies}
+async def get_movies(request: Request, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                     cursor: Optional[str] = None, fields: Optional[str] = None,
+                     genre: Optional[str] = None,
+                     manager: ContentManager = Depends(get_content_manager)):
+    """Get a page of movies ordered by title"""
+    after = decode_cursor(cursor)
+    try:
+        movies = await coalesce(request, "movies", manager.get_movies,
+                                genre=genre, fields=parse_fields(fields), limit=limit, after=after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return page_response("movies", movies, "title", limit)
 
 @app.get("/api/shows")
-async def get_shows():
-    """Get all shows"""
-    from content_manager import ContentManager
-    manager = ContentManager()
-    shows = manager.get_shows()
-    return {"shows": shows}
+async def get_shows(request: Request, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                    cursor: Optional[str] = None, fields: Optional[str] = None,
+                    genre: Optional[str] = None,
+                    manager: ContentManager = Depends(get_content_manager)):
+    """Get a page of shows ordered by title"""
+    after = decode_cursor(cursor)
+    try:
+        shows = await coalesce(request, "shows", manager.get_shows,
+                               genre=genre, fields=parse_fields(fields), limit=limit, after=after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return page_response("shows", shows, "title", limit)
 
 @app.post("/api/channels")
-async def add_channel(channel_data: dict):
+async def add_channel(channel_data: dict, manager: ContentManager = Depends(get_content_manager)):
     """Add a new channel"""
     try:
-        from content_manager import ContentManager
-        manager = ContentManager()
         channel_id = manager.add_channel(channel_data)
         return {"message": "Channel added successfully", "channel_id": channel_id}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/api/movies")
-async def add_movie(movie_data: dict):
+async def add_movie(movie_data: dict, manager: ContentManager = Depends(get_content_manager)):
     """Add a new movie"""
     try:
-        from content_manager import ContentManager
-        manager = ContentManager()
         movie_id = manager.add_movie(movie_data)
         return {"message": "Movie added successfully", "movie_id": movie_id}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+PLAYLIST_MEDIA_TYPE = "application/vnd.apple.mpegurl"
+
 @app.get("/playlist.m3u")
-async def get_playlist():
-    """Generate M3U playlist for all channels"""
-    from content_manager import ContentManager
-    manager = ContentManager()
-    channels = manager.get_channels()
+async def get_playlist(request: Request, group: Optional[str] = None, country: Optional[str] = None,
+                       language: Optional[str] = None, content_type: Optional[str] = None,
+                       manager: ContentManager = Depends(get_content_manager)):
+    """Serve the M3U playlist, optionally filtered by group, country, language or content type
     
-    m3u_content = "#EXTM3U\n"
+    The unfiltered playlist comes from the pre-rendered artifact; every
+    variant carries a catalog-version ETag and honours conditional requests.
+    """
+    version, updated_at = await asyncio.to_thread(manager.get_catalog_version)
+    headers = {
+        "Content-Disposition": "attachment; filename=playlist.m3u",
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding"
+    }
+    filters = {key: value for key, value in (("group", group), ("country", country),
+                                             ("language", language), ("content_type", content_type)) if value}
     
-    for channel in channels:
-        m3u_content += f'#EXTINF:-1 tvg-id="{channel["tvg_id"]}" tvg-name="{channel["tvg_name"]}" tvg-logo="{channel["logo"]}" group-title="{channel["group_title"]}",{channel["name"]}\n'
-        m3u_content += f"{channel['url']}\n"
+    if not filters:
+        artifact = request.app.state.playlist_cache.get(version, updated_at)
+        if artifact is not None:
+            return artifact_response(request, artifact, PLAYLIST_MEDIA_TYPE, headers)
     
-    return StreamingResponse(
-        iter([m3u_content]),
-        media_type="application/vnd.apple.mpegurl",
-        headers={"Content-Disposition": "attachment; filename=playlist.m3u"}
-    )
+    # Filtered or not yet rendered: stream straight from the catalog
+    encoding = negotiate_encoding(request, available_encodings())
+    headers["ETag"] = representation_etag(catalog_etag("playlist", version, filters), encoding)
+    headers["Last-Modified"] = http_date(updated_at)
+    if is_not_modified(request, headers["ETag"], headers["Last-Modified"]):
+        return Response(status_code=304, headers=headers)
+    
+    channels = manager.iter_channels(group_title=group, country=country, language=language,
+                                     content_type=content_type, fields=PLAYLIST_FIELDS)
+    chunks = request.app.state.flights["playlist"].stream(render_playlist(channels))
+    return await encoded_stream_response(chunks, encoding, PLAYLIST_MEDIA_TYPE, headers)
+
+EPG_MEDIA_TYPE = "application/xml"
+
+# Longest guide window a client can ask for
+MAX_EPG_HOURS = 14 * 24
+
+def parse_epg_start(start: Optional[str]) -> Optional[int]:
+    """Parse start= as a unix timestamp or an ISO 8601 time (UTC unless an offset is given)"""
+    if not start:
+        return None
+    if start.isdigit():
+        return int(start)
+    try:
+        moment = datetime.fromisoformat(start)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid start, expected a unix timestamp or ISO 8601 time")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
 
 @app.get("/epg.xml")
-async def get_epg():
-    """Generate EPG (Electronic Program Guide)"""
-    from content_manager import ContentManager
-    manager = ContentManager()
-    channels = manager.get_channels()
+async def get_epg(request: Request, hours: Optional[int] = Query(None, ge=1, le=MAX_EPG_HOURS),
+                  start: Optional[str] = None, channels: Optional[str] = None,
+                  group: Optional[str] = None,
+                  manager: ContentManager = Depends(get_content_manager)):
+    """Serve the EPG (Electronic Program Guide), optionally limited to a time window and channels
     
-    epg_content = '<?xml version="1.0" encoding="UTF-8"?>\n'
-    epg_content += '<!DOCTYPE tv SYSTEM "xmltv.dtd">\n'
-    epg_content += '<tv>\n'
+    hours= returns the next N hours from start= (default: the current hour);
+    channels= takes comma separated tvg ids and group= a group title. Without
+    parameters the full pre-rendered guide is served.
+    """
+    version, updated_at = await asyncio.to_thread(manager.get_catalog_version)
+    headers = {
+        "Content-Disposition": "attachment; filename=epg.xml",
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding"
+    }
     
-    for channel in channels:
-        epg_content += f'  <channel id="{channel["tvg_id"]}">\n'
-        epg_content += f'    <display-name>{channel["name"]}</display-name>\n'
-        epg_content += f'    <icon src="{channel["logo"]}"/>\n'
-        epg_content += f'  </channel>\n'
+    window_start = parse_epg_start(start)
+    if hours and window_start is None:
+        # Whole hours keep the ETag stable for clients polling within the hour
+        window_start = int(datetime.now(timezone.utc).timestamp()) // 3600 * 3600
+    window_stop = window_start + hours * 3600 if hours else None
+    channel_ids = parse_fields(channels)
+    filters = {key: value for key, value in (("start", window_start), ("stop", window_stop),
+                                             ("channels", channel_ids), ("group", group)) if value}
     
-    # Add sample programs (you can expand this with real EPG data)
-    for channel in channels:
-        epg_content += f'  <programme channel="{channel["tvg_id"]}" start="20240101000000 +0000" stop="20240101010000 +0000">\n'
-        epg_content += f'    <title>Sample Program</title>\n'
-        epg_content += f'    <desc>Sample program description</desc>\n'
-        epg_content += f'  </programme>\n'
+    if not filters:
+        artifact = request.app.state.epg_cache.get(version, updated_at)
+        if artifact is not None:
+            return artifact_response(request, artifact, EPG_MEDIA_TYPE, headers)
     
-    epg_content += '</tv>\n'
+    # Windowed or not yet rendered: stream straight from the catalog
+    encoding = negotiate_encoding(request, available_encodings())
+    headers["ETag"] = representation_etag(catalog_etag("epg", version, filters), encoding)
+    headers["Last-Modified"] = http_date(updated_at)
+    if is_not_modified(request, headers["ETag"], headers["Last-Modified"]):
+        return Response(status_code=304, headers=headers)
     
-    return StreamingResponse(
-        iter([epg_content]),
-        media_type="application/xml",
-        headers={"Content-Disposition": "attachment; filename=epg.xml"}
+    guide = render_epg(
+        manager.iter_guide_channels(channel_ids=channel_ids, group_title=group),
+        manager.iter_programmes(start=window_start, stop=window_stop, channel_ids=channel_ids, group_title=group)
     )
+    chunks = request.app.state.flights["epg"].stream(guide)
+    return await encoded_stream_response(chunks, encoding, EPG_MEDIA_TYPE, headers)
+
+# Most channels a single now/next lookup may ask for
+MAX_LOOKUP_CHANNELS = 500
+
+def parse_lookup_channels(channels: str) -> List[str]:
+    """Split channels= into tvg ids, enforcing the per-request limit"""
+    channel_ids = parse_fields(channels) or []
+    if not channel_ids:
+        raise HTTPException(status_code=400, detail="channels must list at least one tvg id")
+    if len(channel_ids) > MAX_LOOKUP_CHANNELS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_LOOKUP_CHANNELS} channels per request")
+    return channel_ids
+
+@app.get("/api/epg/now")
+async def get_epg_now(request: Request, channels: str = Query(..., min_length=1)):
+    """Get the programme currently airing on each of the given tvg ids"""
+    channel_ids = parse_lookup_channels(channels)
+    index = request.app.state.guide_index
+    await index.ensure_current()
+    
+    now = int(datetime.now(timezone.utc).timestamp())
+    return {"time": now, "channels": index.now(channel_ids, at=now)}
+
+@app.get("/api/epg/next")
+async def get_epg_next(request: Request, channels: str = Query(..., min_length=1),
+                       count: int = Query(1, ge=1, le=10)):
+    """Get the next count programmes starting on each of the given tvg ids"""
+    channel_ids = parse_lookup_channels(channels)
+    index = request.app.state.guide_index
+    await index.ensure_current()
+    
+    now = int(datetime.now(timezone.utc).timestamp())
+    return {"time": now, "channels": index.next(channel_ids, count=count, at=now)}
 
 @app.get("/stream/{content_type}/{content_id}")
-async def stream_content(content_type: str, content_id: int):
-    """Stream content (channels, movies, shows)"""
+async def stream_content(request: Request, content_type: str, content_id: int,
+                         manager: ContentManager = Depends(get_content_manager)):
+    """Stream content (channels, movies, episodes)"""
     if content_type == "channel":
-        if content_id <= len(channels_db):
-            channel = channels_db[content_id - 1]
-            # For now, redirect to the channel URL
-            # In a real implementation, you'd proxy the stream
-            return {"redirect": channel.url}
+        channel = manager.get_channel(content_id)
+        if channel and channel["is_active"]:
+            if channel["url"].split("?")[0].endswith(".m3u8"):
+                # HLS sources go through the caching playlist proxy
+                return {"redirect": f"/hls/{content_id}/index.m3u8"}
+            if channel["content_type"] != "live":
+                # VOD sources cannot share a byte stream, send the player upstream
+                return {"redirect": channel["url"]}
+            
+            # Every viewer of a live channel shares one upstream connection
+            try:
+                stream = await request.app.state.relay.open(content_id, channel["url"])
+            except UpstreamError as e:
+                raise HTTPException(status_code=502, detail=f"Upstream unavailable: {e}")
+            return StreamingResponse(stream, media_type="video/mp2t", headers={"Cache-Control": "no-store"})
     
-    elif content_type == "movie":
-        if content_id <= len(movies_db):
-            movie = movies_db[content_id - 1]
-            if os.path.exists(movie.file_path):
-                return FileResponse(movie.file_path)
+    elif content_type in ("movie", "episode"):
+        item = manager.get_movie(content_id) if content_type == "movie" else manager.get_episode(content_id)
+        if item and item["is_active"]:
+            # Seeking players send Range requests; each one is served straight from the file
+            try:
+                return RangeFileResponse(item["file_path"], request.headers)
+            except OSError:
+                pass
     
     elif content_type == "show":
-        # This would need episode selection logic
+        # Shows are streamed episode by episode via /stream/episode/{id}
         pass
     
     raise HTTPException(status_code=404, detail="Content not found")
 
 @app.post("/api/import/playlist")
-async def import_playlist(file_path: str, background_tasks: BackgroundTasks):
+async def import_playlist(file_path: str, background_tasks: BackgroundTasks,
+                          manager: ContentManager = Depends(get_content_manager)):
     """Import channels from an existing M3U playlist"""
-    background_tasks.add_task(parse_m3u_playlist, file_path)
+    background_tasks.add_task(parse_m3u_playlist, file_path, manager)
     return {"message": "Playlist import started"}
 
-async def parse_m3u_playlist(file_path: str):
+async def parse_m3u_playlist(file_path: str, manager: ContentManager):
     """Parse M3U playlist and add channels to database"""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        def parse_entries():
+            for entry in parse_m3u_file(file_path):
+                yield {
+                    "name": entry.name,
+                    "url": entry.url,
+                    "tvg_id": entry.tvg_id,
+                    "tvg_name": entry.tvg_name,
+                    "logo": entry.logo,
+                    "group_title": entry.group_title
+                }
         
-        lines = content.split('\n')
-        current_channel = None
-        
-        for line in lines:
-            line = line.strip()
-            if line.startswith('#EXTINF:'):
-                # Parse channel info
-                info = line[8:]  # Remove '#EXTINF:'
-                parts = info.split(',', 1)
-                if len(parts) == 2:
-                    attrs = parts[0]
-                    name = parts[1]
-                    
-                    # Parse attributes
-                    tvg_id = ""
-                    tvg_name = ""
-                    tvg_logo = ""
-                    group_title = ""
-                    
-                    if 'tvg-id=' in attrs:
-                        tvg_id = attrs.split('tvg-id="')[1].split('"')[0]
-                    if 'tvg-name=' in attrs:
-                        tvg_name = attrs.split('tvg-name="')[1].split('"')[0]
-                    if 'tvg-logo=' in attrs:
-                        tvg_logo = attrs.split('tvg-logo="')[1].split('"')[0]
-                    if 'group-title=' in attrs:
-                        group_title = attrs.split('group-title="')[1].split('"')[0]
-                    
-                    current_channel = {
-                        "name": name,
-                        "tvg_id": tvg_id,
-                        "tvg_name": tvg_name,
-                        "logo": tvg_logo,
-                        "group_title": group_title
-                    }
-            
-            elif line and not line.startswith('#') and current_channel:
-                # This is the URL
-                current_channel["url"] = line
-                channel = Channel(**current_channel)
-                channels_db.append(channel)
-                current_channel = None
+        # Batched inserts are blocking sqlite work, keep them off the event loop
+        channel_ids = await asyncio.to_thread(manager.add_channels, parse_entries())
         
-        logger.info(f"Imported {len([c for c in channels_db if c.url])} channels from playlist")
+        logger.info(f"Imported {len(channel_ids)} channels from playlist")
         
     except Exception as e:
         logger.error(f"Error parsing playlist: {e}")
 
+@app.get("/hls/{channel_id}/index.m3u8")
+async def hls_index(request: Request, channel_id: int, manager: ContentManager = Depends(get_content_manager)):
+    """Serve a channel's HLS playlist with every URI rewritten to go through this server"""
+    channel = manager.get_channel(channel_id)
+    if not channel or not channel["is_active"]:
+        raise HTTPException(status_code=404, detail="Channel not found")
+    return await hls_playlist_response(request, channel_id, channel["url"])
+
+@app.get("/hls/{channel_id}/{kind}/{name}")
+async def hls_resource(request: Request, channel_id: int, kind: str, name: str):
+    """Serve a proxied variant playlist or a cached segment"""
+    proxy = request.app.state.hls
+    url = proxy.unsign(name)
+    if url is None or kind not in ("playlist", "segment"):
+        raise HTTPException(status_code=404, detail="Unknown HLS resource")
+    if kind == "playlist":
+        return await hls_playlist_response(request, channel_id, url)
+    
+    try:
+        data = await proxy.segment(url)
+    except Overloaded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Upstream segment failed: {e}")
+    media_type = SEGMENT_MEDIA_TYPES.get(os.path.splitext(name)[1], "application/octet-stream")
+    # Segment URIs never change content, let players and proxies keep them
+    return Response(data, media_type=media_type, headers={"Cache-Control": "public, max-age=300"})
+
+async def hls_playlist_response(request: Request, channel_id: int, url: str) -> Response:
+    """Fetch, rewrite and return an HLS playlist"""
+    try:
+        playlist = await request.app.state.hls.playlist(channel_id, url)
+    except Overloaded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Upstream playlist failed: {e}")
+    return Response(playlist, media_type=HLS_MEDIA_TYPE, headers={"Cache-Control": "no-cache"})
+
+@app.get("/api/hls")
+async def get_hls_status(request: Request):
+    """Segment cache and prefetch statistics for the HLS proxy"""
+    return request.app.state.hls.stats()
+
+@app.get("/api/relay")
+async def get_relay_status(request: Request):
+    """List live channels currently relayed and their viewers"""
+    return {"relays": request.app.state.relay.status()}
+
 @app.get("/api/stats")
-async def get_stats():
+async def get_stats(request: Request, manager: ContentManager = Depends(get_content_manager)):
     """Get server statistics"""
-    from content_manager import ContentManager
-    manager = ContentManager()
-    stats = manager.get_statistics()
+    # Copy: the coalesced result is shared with concurrent callers
+    stats = dict(await coalesce(request, "stats", manager.get_statistics))
     stats.update({
         "server_uptime": "Running",
         "last_updated": datetime.now().isoformat()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+IPTV Media Files
+Range-aware file responses for streaming movies and episodes from disk
+"""
+
+import os
+import asyncio
+import mimetypes
+from email.utils import formatdate
+from typing import Mapping, Optional, Tuple
+from starlette.responses import Response
+
+# Read size for file bodies; each chunk is one worker-thread read
+CHUNK_SIZE = 1024 * 1024
+
+# Video types the platform mimetypes table often lacks
+VIDEO_TYPES = {
+    ".mkv": "video/x-matroska",
+    ".m4v": "video/x-m4v",
+    ".webm": "video/webm",
+    ".flv": "video/x-flv",
+    ".wmv": "video/x-ms-wmv",
+    ".avi": "video/x-msvideo",
+    ".mov": "video/quicktime",
+    ".mp4": "video/mp4",
+    ".ts": "video/mp2t"
+}
+
+class RangeNotSatisfiable(Exception):
+    """The requested byte range starts past the end of the file"""
+
+def guess_media_type(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    return VIDEO_TYPES.get(extension) or mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+def file_etag(stat_result: os.stat_result) -> str:
+    """Strong validator from modification time and size"""
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single bytes Range header into an inclusive (start, end)
+
+    Returns None for headers that should be ignored (other units, malformed
+    or multiple ranges), so the full file is sent instead.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, separator, last = spec.strip().partition("-")
+    if not separator:
+        return None
+
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0 or size == 0:
+                raise RangeNotSatisfiable()
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else None
+    except ValueError:
+        return None
+    if end is not None and end < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, size - 1 if end is None else min(end, size - 1)
+
+def if_range_matches(if_range: Optional[str], etag: str, last_modified: str) -> bool:
+    """Whether a Range may be honoured given the request's If-Range validator"""
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith(('"', "W/")):
+        return if_range == etag
+    return if_range == last_modified
+
+class RangeFileResponse(Response):
+    """Sends a file or one byte range of it, honouring Range, If-Range and If-None-Match
+
+    The body is read in CHUNK_SIZE pieces on a worker thread and sent as
+    it is read, so a seek into a large movie only reads the requested
+    range and never holds more than one chunk in memory. Every response
+    opens its own file handle, so any number of viewers can seek through
+    the same file.
+    """
+
+    chunk_size = CHUNK_SIZE
+
+    def __init__(self, path: str, request_headers: Mapping[str, str], media_type: Optional[str] = None,
+                 stat_result: Optional[os.stat_result] = None):
+        self.path = path
+        stat_result = stat_result or os.stat(path)
+        size = stat_result.st_size
+        etag = file_etag(stat_result)
+        last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+        headers = {"Accept-Ranges": "bytes", "ETag": etag, "Last-Modified": last_modified}
+
+        self.status_code = 200
+        self.start, self.length = 0, size
+        if_none_match = request_headers.get("if-none-match")
+        range_header = request_headers.get("range")
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            self.status_code, self.length = 304, 0
+        elif range_header and if_range_matches(request_headers.get("if-range"), etag, last_modified):
+            try:
+                byte_range = parse_range(range_header, size)
+            except RangeNotSatisfiable:
+                self.status_code, self.length = 416, 0
+                headers["Content-Range"] = f"bytes */{size}"
+            else:
+                if byte_range is not None:
+                    start, end = byte_range
+                    self.status_code, self.start, self.length = 206, start, end - start + 1
+                    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        if self.status_code != 304:
+            headers["Content-Length"] = str(self.length)
+
+        self.media_type = media_type or guess_media_type(path)
+        self.background = None
+        self.init_headers(headers)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD" or self.length == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        with open(self.path, "rb") as file:
+            await asyncio.to_thread(file.seek, self.start)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await asyncio.to_thread(file.read, min(self.chunk_size, remaining))
+                if not chunk:
+                    # File shrank underneath us; end the body rather than hang the client
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b""})
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+IPTV Playlist Rendering
+Streams M3U playlists from channel rows in bounded-size chunks
+"""
+
+from typing import Iterable, Iterator, Mapping
+
+# Columns a channel row needs for an #EXTINF entry (id and name are always selected)
+PLAYLIST_FIELDS = ["url", "logo", "tvg_id", "tvg_name", "group_title"]
+
+# Flush buffered entries once they reach this many characters
+CHUNK_SIZE = 64 * 1024
+
+_ATTRIBUTE_ESCAPES = str.maketrans({'"': "'", "\r": " ", "\n": " "})
+_LINE_ESCAPES = str.maketrans({"\r": " ", "\n": " "})
+
+def m3u_attribute(value) -> str:
+    """Make a value safe inside a double-quoted EXTINF attribute"""
+    if value is None:
+        return ""
+    return str(value).translate(_ATTRIBUTE_ESCAPES)
+
+def m3u_line(value) -> str:
+    """Make a value safe as a single M3U line (channel title or URL)"""
+    if value is None:
+        return ""
+    return str(value).translate(_LINE_ESCAPES).strip()
+
+def render_entry(channel: Mapping) -> str:
+    """Render the #EXTINF and URL lines for one channel"""
+    return (
+        f'#EXTINF:-1 tvg-id="{m3u_attribute(channel["tvg_id"])}"'
+        f' tvg-name="{m3u_attribute(channel["tvg_name"])}"'
+        f' tvg-logo="{m3u_attribute(channel["logo"])}"'
+        f' group-title="{m3u_attribute(channel["group_title"])}",{m3u_line(channel["name"])}\n'
+        f'{m3u_line(channel["url"])}\n'
+    )
+
+def chunked(pieces: Iterable[str], chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """Join small text pieces into chunks of roughly chunk_size characters"""
+    buffer = []
+    buffered = 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= chunk_size:
+            yield "".join(buffer)
+            buffer = []
+            buffered = 0
+    
+    if buffer:
+        yield "".join(buffer)
+
+def render_playlist(channels: Iterable[Mapping], chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """Yield an M3U playlist in chunks as channel rows arrive
+    
+    The header is yielded on its own so clients get the first byte before
+    the first database batch is read.
+    """
+    yield "#EXTM3U\n"
+    yield from chunked((render_entry(channel) for channel in channels), chunk_size)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+IPTV Playlist Import
+Streams remote M3U playlists into the database while they download
+"""
+
+import queue
+import threading
+from itertools import islice
+from typing import Callable, Dict, Iterable, Optional
+import requests
+from content_manager import ContentManager
+from m3u import M3UEntry, parse_m3u
+
+# (connect, read) timeouts for playlist downloads
+DOWNLOAD_TIMEOUT = (10, 60)
+# Network read size; lines are parsed as each chunk arrives
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Parsed batches waiting for the writer; the download pauses when this many are queued
+QUEUED_BATCHES = 4
+
+class InvalidPlaylist(ValueError):
+    """The response did not start with an #EXTM3U header"""
+
+def require_header(lines: Iterable) -> Iterable:
+    """Pass lines through after checking the first non-empty one is #EXTM3U"""
+    lines = iter(lines)
+    for line in lines:
+        text = line.decode("utf-8", "replace") if isinstance(line, bytes) else line
+        text = text.strip().lstrip("\ufeff")
+        if not text:
+            continue
+        if not text.startswith("#EXTM3U"):
+            raise InvalidPlaylist("Not a valid M3U playlist")
+        yield line
+        break
+    yield from lines
+
+def import_entries(manager: ContentManager, lines: Iterable, to_channel: Callable[[M3UEntry], Dict],
+                   batch_size: int = 1000, progress: Optional[Callable[[int], None]] = None) -> int:
+    """Parse playlist lines and insert the channels on a writer thread as batches fill up
+
+    Parsing (and whatever produces the lines, usually the network) runs on
+    the calling thread while the previous batches are being inserted. The
+    queue between them is bounded, so memory stays flat however large the
+    playlist is. progress(total_committed) is called from the writer
+    thread; batches committed before an error stay committed.
+    """
+    batches: "queue.Queue[Optional[list]]" = queue.Queue(maxsize=QUEUED_BATCHES)
+    state = {"committed": 0, "error": None}
+
+    def write():
+        try:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    return
+                if state["error"] is not None:
+                    continue  # drain so the producer never blocks on a dead writer
+                try:
+                    manager.add_channels(batch, batch_size=len(batch))
+                except Exception as e:
+                    state["error"] = e
+                    continue
+                state["committed"] += len(batch)
+                if progress:
+                    progress(state["committed"])
+        finally:
+            # This thread ends with the import; don't leave its connection in the pool
+            manager.release_thread_connection()
+
+    writer = threading.Thread(target=write, name="playlist-writer", daemon=True)
+    writer.start()
+    try:
+        channels = (to_channel(entry) for entry in parse_m3u(lines))
+        while state["error"] is None:
+            batch = list(islice(channels, batch_size))
+            if not batch:
+                break
+            batches.put(batch)
+    finally:
+        batches.put(None)
+        writer.join()
+
+    if state["error"] is not None:
+        raise state["error"]
+    return state["committed"]
+
+def import_playlist_url(manager: ContentManager, url: str, to_channel: Callable[[M3UEntry], Dict],
+                        session: Optional[requests.Session] = None, batch_size: int = 1000,
+                        progress: Optional[Callable[[int], None]] = None) -> int:
+    """Download a playlist and import its channels while it streams in; returns the number imported
+
+    Raises requests errors for failed downloads and InvalidPlaylist when
+    the body is not an M3U playlist.
+    """
+    session = session or requests.Session()
+    with session.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        lines = require_header(response.iter_lines(chunk_size=DOWNLOAD_CHUNK_SIZE))
+        return import_entries(manager, lines, to_channel, batch_size, progress)
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+IPTV Stream Relay
+Shares one upstream MPEG-TS connection per live channel between all its viewers
+"""
+
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from typing import AsyncIterator, Callable, ContextManager, Dict, Iterable, List, Optional
+import requests
+
+logger = logging.getLogger(__name__)
+
+# 348 TS packets of 188 bytes, so chunks stay packet aligned
+CHUNK_SIZE = 188 * 348
+# (connect, read) timeouts for upstream providers
+UPSTREAM_TIMEOUT = (5, 30)
+
+Opener = Callable[[str, int], ContextManager[Iterable[bytes]]]
+
+@contextmanager
+def http_upstream(url: str, chunk_size: int):
+    """Open an upstream HTTP stream and expose it as an iterable of byte chunks"""
+    with requests.get(url, stream=True, timeout=UPSTREAM_TIMEOUT) as response:
+        response.raise_for_status()
+        yield response.iter_content(chunk_size)
+
+class UpstreamError(Exception):
+    """Raised to viewers when the upstream could not be opened"""
+
+class ChannelRelay:
+    """One upstream connection fanned out to any number of viewers through a ring buffer
+
+    The upstream is read on a dedicated thread (not the shared default
+    executor, which a long-lived stream would occupy for good) and every
+    chunk is published into a fixed-size ring. Each viewer keeps its own read position; the
+    producer never waits for viewers, so a viewer that falls more than a
+    ring behind is dropped instead of stalling the others.
+    """
+
+    def __init__(self, key, url: str, opener: Opener = http_upstream, buffer_chunks: int = 64,
+                 start_chunks: int = 4, idle_grace: float = 10.0, chunk_size: int = CHUNK_SIZE,
+                 on_close: Optional[Callable[["ChannelRelay"], None]] = None):
+        self.key = key
+        self.url = url
+        self.opener = opener
+        self.chunk_size = chunk_size
+        self.start_chunks = start_chunks
+        self.idle_grace = idle_grace
+        self.on_close = on_close
+        self.viewers = 0
+        self.dropped = 0
+        self._slots: List[Optional[bytes]] = [None] * buffer_chunks
+        self._head = 0
+        self._ended = False
+        self._closing = False
+        self._error: Optional[Exception] = None
+        self._loop = asyncio.get_running_loop()
+        self._ready = self._loop.create_future()
+        self._waiter = self._loop.create_future()
+        self._idle_task: Optional[asyncio.Task] = None
+        self._reader = threading.Thread(target=self._pump, name=f"relay-{key}", daemon=True)
+        self._reader.start()
+
+    @property
+    def oldest(self) -> int:
+        """Sequence number of the oldest chunk still in the ring"""
+        return max(0, self._head - len(self._slots))
+
+    def _pump(self):
+        try:
+            self._read_upstream()
+        except Exception as e:
+            logger.warning(f"Upstream for channel {self.key} failed: {e}")
+            self._error = e
+        finally:
+            try:
+                self._loop.call_soon_threadsafe(self._finish)
+            except RuntimeError:
+                pass  # event loop already closed at shutdown
+
+    def _read_upstream(self):
+        with self.opener(self.url, self.chunk_size) as chunks:
+            for chunk in chunks:
+                if self._closing:
+                    break
+                if chunk:
+                    self._loop.call_soon_threadsafe(self._publish, chunk)
+
+    def _publish(self, chunk: bytes):
+        self._slots[self._head % len(self._slots)] = chunk
+        self._head += 1
+        if not self._ready.done():
+            self._ready.set_result(None)
+        self._wake()
+
+    def _finish(self):
+        self._ended = True
+        if not self._ready.done():
+            self._ready.set_exception(UpstreamError(str(self._error or "upstream ended")))
+            # Nobody may ever await it; don't let asyncio log it as unretrieved
+            self._ready.exception()
+        self._wake()
+        self.close()
+
+    def _wake(self):
+        waiter, self._waiter = self._waiter, self._loop.create_future()
+        waiter.set_result(None)
+
+    async def wait_ready(self, timeout: float):
+        """Wait for the first upstream chunk; raises UpstreamError if it never comes"""
+        try:
+            await asyncio.wait_for(asyncio.shield(self._ready), timeout)
+        except asyncio.TimeoutError:
+            raise UpstreamError(f"no data from upstream within {timeout}s")
+
+    def subscribe(self) -> AsyncIterator[bytes]:
+        """Return a viewer stream that starts close to the live edge
+
+        The viewer is counted once iteration starts and released when it
+        stops, so a stream dropped before its first chunk never holds the
+        upstream open. The stream ends with the upstream or as soon as the
+        viewer falls behind the ring.
+        """
+        if self.viewers == 0:
+            # Close after the grace period unless this stream actually starts
+            self._schedule_idle_close()
+        return self._stream()
+
+    async def _stream(self) -> AsyncIterator[bytes]:
+        self.viewers += 1
+        if self._idle_task is not None:
+            self._idle_task.cancel()
+            self._idle_task = None
+        try:
+            # Start a few chunks back so players get data immediately
+            position = max(self.oldest, self._head - self.start_chunks)
+            while True:
+                if position < self.oldest:
+                    self.dropped += 1
+                    logger.info(f"Dropped slow viewer of channel {self.key}")
+                    return
+                if position < self._head:
+                    chunk = self._slots[position % len(self._slots)]
+                    position += 1
+                    yield chunk
+                    continue
+                if self._ended:
+                    return
+                await self._waiter
+        finally:
+            self.release()
+
+    def release(self):
+        """Drop a viewer; the upstream closes after the idle grace period once none are left"""
+        self.viewers -= 1
+        if self.viewers == 0:
+            self._schedule_idle_close()
+
+    def _schedule_idle_close(self):
+        if self._idle_task is None and not self._ended and not self._closing:
+            self._idle_task = self._loop.create_task(self._close_when_idle())
+
+    async def _close_when_idle(self):
+        await asyncio.sleep(self.idle_grace)
+        self._idle_task = None
+        if self.viewers == 0:
+            logger.info(f"Closing idle upstream for channel {self.key}")
+            self.close()
+
+    def close(self):
+        """Stop reading upstream (the worker notices before its next chunk)"""
+        if self._closing:
+            return
+        self._closing = True
+        if self.on_close:
+            self.on_close(self)
+
+class StreamRelay:
+    """Registry of active channel relays, one per channel"""
+
+    def __init__(self, opener: Opener = http_upstream, buffer_chunks: int = 64, start_chunks: int = 4,
+                 idle_grace: float = 10.0, connect_timeout: float = 10.0):
+        self.opener = opener
+        self.buffer_chunks = buffer_chunks
+        self.start_chunks = start_chunks
+        self.idle_grace = idle_grace
+        self.connect_timeout = connect_timeout
+        self.relays: Dict[object, ChannelRelay] = {}
+
+    async def open(self, key, url: str) -> AsyncIterator[bytes]:
+        """Join (or start) the relay for a channel and return this viewer's stream
+
+        Raises UpstreamError when a new upstream produces no data in time.
+        """
+        relay = self.relays.get(key)
+        if relay is None or relay._closing:
+            relay = ChannelRelay(key, url, self.opener, self.buffer_chunks, self.start_chunks,
+                                 self.idle_grace, on_close=self._forget)
+            self.relays[key] = relay
+        try:
+            await relay.wait_ready(self.connect_timeout)
+        except UpstreamError:
+            if relay.viewers == 0:
+                relay.close()
+            raise
+        return relay.subscribe()
+
+    def _forget(self, relay: ChannelRelay):
+        if self.relays.get(relay.key) is relay:
+            del self.relays[relay.key]
+
+    def status(self) -> List[Dict]:
+        """Describe the active relays"""
+        return [{"channel": relay.key, "viewers": relay.viewers, "dropped": relay.dropped,
+                 "chunks": relay._head} for relay in self.relays.values()]
+
+    def close(self):
+        """Stop every upstream"""
+        for relay in list(self.relays.values()):
+            relay.close()
@@ -7,6 +7,7 @@ import sqlite3
 import requests
 import re
 from content_manager import ContentManager
+from playlist_import import import_playlist_url
 import time
 
 def clear_all_content():
@@ -62,83 +63,45 @@ def get_xtream_codes():
 
 def import_from_xtream_code(xtream_url, manager):
     """Import channels from a single Xtream code"""
+    # Channels are written in batched transactions while the playlist downloads;
+    # a failing batch is rolled back but batches committed before it still count
+    committed = {'count': 0}
+    
+    def record_progress(count):
+        committed['count'] = count
+    
     try:
         print(f"📥 Fetching playlist from: {xtream_url[:80]}...")
         
-        headers = {
+        session = requests.Session()
+        session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
+        })
         
-        response = requests.get(xtream_url, headers=headers, timeout=30)
+        import_playlist_url(manager, xtream_url, xtream_channel, session=session, progress=record_progress)
+        print(f"   ✅ Imported {committed['count']} channels")
         
-        if response.status_code == 200:
-            content = response.text
-            
-            # Parse M3U content
-            channels_imported = parse_m3u_content(content, manager)
-            print(f"   ✅ Imported {channels_imported} channels")
-            return channels_imported
-        else:
-            print(f"   ❌ Failed to fetch playlist (Status: {response.status_code})")
-            return 0
-            
+    except requests.HTTPError as e:
+        print(f"   ❌ Failed to fetch playlist (Status: {e.response.status_code})")
     except Exception as e:
         print(f"   ❌ Error importing from Xtream code: {str(e)}")
-        return 0
-
-def parse_m3u_content(content, manager):
-    """Parse M3U content and add channels to database"""
-    channels_imported = 0
-    lines = content.strip().split('\n')
     
-    current_channel = {}
-    
-    for line in lines:
-        line = line.strip()
-        
-        if line.startswith('#EXTINF:'):
-            # Parse channel info
-            info = line[8:]  # Remove #EXTINF:
-            
-            # Extract attributes
-            attrs = {}
-            if ',' in info:
-                attrs_str, name = info.rsplit(',', 1)
-                attrs_str = attrs_str.strip()
-                name = name.strip()
-                
-                # Parse attributes
-                for attr in attrs_str.split(' '):
-                    if '=' in attr:
-                        key, value = attr.split('=', 1)
-                        attrs[key] = value.strip('"')
-                
-                current_channel = {
-                    'name': name,
-                    'url': '',
-                    'logo': attrs.get('tvg-logo', ''),
-                    'group': attrs.get('group-title', 'General'),
-                    'category': attrs.get('group-title', 'General'),
-                    'country': attrs.get('tvg-country', 'US'),
-                    'language': attrs.get('tvg-language', 'en'),
-                    'tvg_id': attrs.get('tvg-id', ''),
-                    'tvg_name': attrs.get('tvg-name', name)
-                }
-        
-        elif line and not line.startswith('#') and current_channel:
-            # This is the stream URL
-            current_channel['url'] = line
-            
-            # Add channel to database
-            try:
-                manager.add_channel(current_channel)
-                channels_imported += 1
-            except Exception as e:
-                print(f"   ⚠️  Error adding channel {current_channel['name']}: {str(e)}")
-            
-            current_channel = {}
-    
-    return channels_imported
+    return committed['count']
+
+def xtream_channel(entry):
+    """Map a parsed playlist entry to a channel record"""
+    group = entry.group_title or 'General'
+    return {
+        'name': entry.name,
+        'url': entry.url,
+        'logo': entry.logo,
+        'group': group,
+        'category': group,
+        'country': entry.attrs.get('tvg-country', 'US'),
+        'language': entry.attrs.get('tvg-language', 'en'),
+        'tvg_id': entry.tvg_id,
+        'tvg_name': entry.tvg_name or entry.name
+    }
 
 def main():
     """Main function"""
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+IPTV Server Benchmarks
+Measures ContentManager hot paths against a synthetic catalog
+"""
+
+import os
+import sys
+import time
+import asyncio
+import sqlite3
+import argparse
+import tempfile
+import threading
+import tracemalloc
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from contextlib import contextmanager
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "core"))
+
+from content_manager import ContentManager
+from coalescing import Overloaded, SingleFlight
+from relay import StreamRelay
+from hls import HlsProxy, SegmentCache
+from m3u import parse_m3u, parse_m3u_file, parse_m3u_text
+from playlist_import import import_playlist_url
+from hdhomerun_emulator import LineupSnapshot, parse_lineup
+
+
+class UnpooledContentManager(ContentManager):
+    """ContentManager that opens a fresh connection per call (pre-pooling behaviour)"""
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path)
+
+
+def synthetic_channels(count: int):
+    """Yield channel dicts shaped like the master playlist entries"""
+    groups = ["News", "Sports", "Movies", "Series", "Kids", "Music"]
+    for i in range(count):
+        group = groups[i % len(groups)]
+        kind = "movie" if group == "Movies" else "series" if group == "Series" else "live"
+        yield {
+            'name': f"{group} Channel {i}",
+            'url': f"http://provider.example:8080/{kind}/user/pass/{i}.ts",
+            'logo': f"http://logos.example/{i}.png",
+            'category': group,
+            'tvg_id': f"{group.lower()}{i}.example",
+            'tvg_name': f"{group} Channel {i}",
+            'group_title': group
+        }
+
+
+def timed(label: str, func, *args) -> float:
+    """Run func once and print the elapsed wall time"""
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<40} {elapsed:8.3f}s")
+    return elapsed
+
+
+def bench_connections(count: int, reads: int):
+    """Compare per-call connections with the pooled ContentManager"""
+    print(f"📊 Connection pooling: {count} inserts, {reads} statistics reads")
+
+    for label, manager_class in (("per-call connections", UnpooledContentManager),
+                                 ("pooled connection", ContentManager)):
+        with tempfile.TemporaryDirectory() as tmp:
+            manager = manager_class(os.path.join(tmp, "bench.db"))
+
+            def insert_all():
+                for channel in synthetic_channels(count):
+                    manager.add_channel(channel)
+
+            def read_stats():
+                for _ in range(reads):
+                    manager.get_statistics()
+
+            timed(f"{label}: add_channel", insert_all)
+            timed(f"{label}: get_statistics", read_stats)
+            manager.close()
+
+
+def bench_search(count: int, reads: int):
+    """Time typical search_channels query shapes against a populated catalog"""
+    print(f"📊 Channel search: {count} channels, {reads} runs per query")
+
+    queries = (
+        ("single word prefix", "spo"),
+        ("full word", "news"),
+        ("multi word", "sports channel 12"),
+        ("numeric", "4242"),
+        ("no match", "zzzz"),
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = ContentManager(os.path.join(tmp, "bench.db"))
+        manager.add_channels(synthetic_channels(count))
+
+        for label, query in queries:
+            start = time.perf_counter()
+            for _ in range(reads):
+                results = manager.search_channels(query, limit=50)
+            per_query = (time.perf_counter() - start) / reads * 1000
+            print(f"  {label + ' ' + repr(query):<40} {per_query:8.3f}ms/query  {len(results)} results")
+        manager.close()
+
+
+def bench_coalescing(count: int, reads: int):
+    """Fire concurrent identical requests through SingleFlight and count the queries that run"""
+    print(f"📊 Request coalescing: {count} channels, {reads} concurrent identical requests")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = ContentManager(os.path.join(tmp, "bench.db"))
+        manager.add_channels(synthetic_channels(count))
+        queries = []
+
+        def get_channels():
+            queries.append(1)
+            return manager.get_channels(limit=count)
+
+        async def burst(flight: SingleFlight, keys):
+            return await asyncio.gather(*(flight.run(key, get_channels) for key in keys),
+                                        return_exceptions=True)
+
+        start = time.perf_counter()
+        results = asyncio.run(burst(SingleFlight("channels", limit=4), ["all"] * reads))
+        elapsed = time.perf_counter() - start
+        shared = all(result is results[0] for result in results)
+        print(f"  {'identical requests':<40} {elapsed:8.3f}s  {len(queries)} queries, shared result: {shared}")
+
+        queries.clear()
+        results = asyncio.run(burst(SingleFlight("channels", limit=4), range(reads)))
+        shed = sum(isinstance(result, Overloaded) for result in results)
+        print(f"  {'distinct requests (limit 4)':<40} {len(queries)} queries, {shed} answered 503")
+        manager.close()
+
+
+def bench_relay(count: int, reads: int):
+    """Fan a fake live TS source out to concurrent viewers, one of them too slow to keep up"""
+    viewers = min(count, 200)
+    print(f"📊 Stream relay: {viewers} viewers of one channel, {reads} chunks each")
+    opened = []
+
+    @contextmanager
+    def fake_ts_source(url, chunk_size):
+        opened.append(url)
+
+        def chunks():
+            sequence = 0
+            while True:
+                time.sleep(0.001)
+                yield b"\x47" + sequence.to_bytes(4, "big") + bytes(chunk_size - 5)
+                sequence += 1
+        yield chunks()
+
+    async def watch(relay, delay=0.0):
+        received = 0
+        stream = await relay.open(1, "http://fake.example/live.ts")
+        async for _ in stream:
+            received += 1
+            if delay:
+                await asyncio.sleep(delay)
+            if received >= reads:
+                break
+        await stream.aclose()
+        return received
+
+    async def run():
+        relay = StreamRelay(opener=fake_ts_source, buffer_chunks=32, idle_grace=0.1)
+        start = time.perf_counter()
+        results = await asyncio.gather(*[watch(relay) for _ in range(viewers - 1)], watch(relay, delay=0.05))
+        elapsed = time.perf_counter() - start
+        complete = sum(received == reads for received in results)
+        print(f"  {'relay fan-out':<40} {elapsed:8.3f}s  {len(opened)} upstream connection(s), "
+              f"{complete} complete viewers, slow viewer got {results[-1]} chunks")
+        relay.close()
+
+    asyncio.run(run())
+
+
+def bench_hls(count: int, reads: int):
+    """Play a local HLS fixture through the proxy with concurrent viewers"""
+    viewers = min(count, 50)
+    segments = 10
+    print(f"📊 HLS proxy: {viewers} viewers, {segments} segments of a local fixture")
+    upstream_requests = []
+
+    class FixtureHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            upstream_requests.append(self.path)
+            if self.path.endswith(".m3u8"):
+                body = "#EXTM3U\n#EXT-X-TARGETDURATION:2\n" + "".join(
+                    f"#EXTINF:2,\nseg{i}.ts\n" for i in range(segments))
+                body = body.encode()
+            else:
+                time.sleep(0.05)  # provider latency
+                body = bytes(512 * 1024)
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def fetch(url):
+        with urllib.request.urlopen(url) as response:
+            return response.url, response.read()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    playlist_url = f"http://127.0.0.1:{server.server_port}/live/index.m3u8"
+
+    async def watch(proxy):
+        playlist = await proxy.playlist(1, playlist_url)
+        waits = []
+        for line in playlist.splitlines():
+            if line.startswith("/hls/"):
+                start = time.perf_counter()
+                await proxy.segment(proxy.unsign(line.rsplit("/", 1)[1]))
+                waits.append(time.perf_counter() - start)
+                await asyncio.sleep(0.1)  # playback between segment requests
+        return waits
+
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            proxy = HlsProxy(SegmentCache(64 * 1024 * 1024, 256 * 1024 * 1024, Path(tmp)), fetch=fetch)
+            results = await asyncio.gather(*[watch(proxy) for _ in range(viewers)])
+            waits = sorted(wait for result in results for wait in result)
+            print(f"  {'segment wait (median / max)':<40} {waits[len(waits) // 2] * 1000:8.3f}ms / "
+                  f"{waits[-1] * 1000:.3f}ms")
+            print(f"  {'upstream requests':<40} {len(upstream_requests)} "
+                  f"(vs {viewers * (segments + 1)} without the proxy)")
+            proxy.close()
+
+    asyncio.run(run())
+    server.shutdown()
+
+
+def bench_lineup(count: int, reads: int):
+    """Compare tuning by re-parsing the playlist against the emulator's cached lineup"""
+    print(f"📊 HDHomeRun lineup: {count} channels, {reads} tunes")
+    playlist = "#EXTM3U\n" + "".join(
+        f'#EXTINF:-1 tvg-id="{channel["tvg_id"]}",{channel["name"]}\n{channel["url"]}\n'
+        for channel in synthetic_channels(count))
+    numbers = [str(i % count + 1) for i in range(0, reads * 7919, 7919)]
+
+    def rescan():
+        for number in numbers:
+            dict(enumerate((url for _, _, url in parse_lineup(playlist)), 1))[int(number)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = ContentManager(os.path.join(tmp, "bench.db"))
+        entries = parse_lineup(playlist)
+        snapshot = None
+
+        def build():
+            nonlocal snapshot
+            version = manager.sync_guide_numbers(parse_lineup(playlist))
+            snapshot = LineupSnapshot(manager.get_guide_numbers(), "http://127.0.0.1:6077", version)
+
+        def lookup():
+            for number in numbers:
+                snapshot.urls[number]
+
+        timed("parse playlist per tune", rescan)
+        timed("number and build snapshot once", build)
+        timed("cached guide number lookups", lookup)
+        print(f"  {'lineup.json body (plain / gzip)':<40} {len(snapshot.body)} / {len(snapshot.gzip_body)} bytes")
+
+        # Provider reorders the playlist and drops a few channels
+        reordered = entries[::-1][:-10]
+        version = snapshot.version
+        timed("renumber reordered playlist", manager.sync_guide_numbers, reordered)
+        changes = manager.get_lineup_changes(version)
+        kept = sum(1 for row in manager.get_guide_numbers() if snapshot.urls[str(row["number"])] == row["url"])
+        print(f"  {'numbers kept / lineup changes':<40} {kept} / {len(changes)}")
+        manager.close()
+
+
+def bench_m3u(count: int, reads: int):
+    """Measure parser throughput on a synthetic playlist (500k entries at the default --count)"""
+    entries = count * 100
+    print(f"📊 M3U parser: {entries} entries")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.m3u")
+        channels = list(synthetic_channels(count))
+        with open(path, "w", encoding="utf-8") as f:
+            f.write('#EXTM3U x-tvg-url="http://epg.example/guide.xml"\n')
+            for i in range(entries):
+                channel = channels[i % count]
+                f.write(f'#EXTINF:-1 tvg-id="{channel["tvg_id"]}" tvg-name="{channel["tvg_name"]}" '
+                        f'tvg-logo="{channel["logo"]}" group-title="{channel["group_title"]}, Live",'
+                        f'{channel["name"]}, East\n')
+                if i % 10 == 0:
+                    f.write(f"#EXTGRP:{channel['group_title']}\n#EXTVLCOPT:http-user-agent=VLC/3.0\n")
+                f.write(f"{channel['url']}\n")
+        with open(path, encoding="utf-8") as f:
+            lines = f.readlines()
+
+        parsed = []
+
+        def parse_lines():
+            parsed.append(sum(1 for _ in parse_m3u(lines)))
+
+        def parse_file():
+            parsed.append(sum(1 for _ in parse_m3u_file(path)))
+
+        elapsed = timed("parse in-memory lines", parse_lines)
+        print(f"  {'lines per second':<40} {len(lines) / elapsed:12,.0f}")
+        elapsed = timed("parse file (streamed)", parse_file)
+        print(f"  {'lines per second':<40} {len(lines) / elapsed:12,.0f}")
+        print(f"  {'entries parsed':<40} {parsed[0]} / {parsed[1]}")
+
+
+def bench_import(count: int, reads: int):
+    """Import a large playlist from a local HTTP stand-in, buffered against streamed"""
+    entries = count * 20
+    print(f"📊 Playlist import: {entries} entries over local HTTP")
+    channels = list(synthetic_channels(count))
+
+    class PlaylistHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            # Generated as it is sent, so the stand-in itself holds no playlist
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/x-mpegurl")
+            self.end_headers()
+            self.wfile.write(b"#EXTM3U\n")
+            for start in range(0, entries, 1000):
+                self.wfile.write("".join(
+                    f'#EXTINF:-1 tvg-id="{channel["tvg_id"]}" tvg-logo="{channel["logo"]}" '
+                    f'group-title="{channel["group_title"]}",{channel["name"]}\n{channel["url"]}\n'
+                    for channel in (channels[i % count] for i in range(start, min(start + 1000, entries)))
+                ).encode())
+
+    def to_channel(entry):
+        return {"name": entry.name, "url": entry.url, "logo": entry.logo, "tvg_id": entry.tvg_id,
+                "tvg_name": entry.tvg_name or entry.name, "group_title": entry.group_title}
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PlaylistHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/playlist.m3u"
+
+    def buffered(manager):
+        text = requests.get(url, timeout=60).text
+        return len(manager.add_channels(to_channel(entry) for entry in parse_m3u_text(text)))
+
+    def streamed(manager):
+        return import_playlist_url(manager, url, to_channel)
+
+    for label, run in (("buffered (.text, then parse)", buffered), ("streamed (parse while downloading)", streamed)):
+        with tempfile.TemporaryDirectory() as tmp:
+            manager = ContentManager(os.path.join(tmp, "bench.db"))
+            tracemalloc.start()
+            start = time.perf_counter()
+            imported = run(manager)
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"  {label:<40} {elapsed:8.3f}s  peak {peak / 1024 / 1024:6.1f}MB  {imported} channels")
+            manager.close()
+    server.shutdown()
+
+
+BENCHMARKS = {
+    'connections': bench_connections,
+    'search': bench_search,
+    'coalescing': bench_coalescing,
+    'relay': bench_relay,
+    'hls': bench_hls,
+    'lineup': bench_lineup,
+    'm3u': bench_m3u,
+    'import': bench_import,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run IPTV server benchmarks")
+    parser.add_argument('benchmarks', nargs='*',
+                        help=f"benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument('--count', type=int, default=5000, help="number of synthetic channels")
+    parser.add_argument('--reads', type=int, default=200, help="number of repeated read calls")
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    for name in args.benchmarks or BENCHMARKS:
+        BENCHMARKS[name](args.count, args.reads)
+        print()
+
+
+if __name__ == "__main__":
+    main()
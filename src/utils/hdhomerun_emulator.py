@@ -3,15 +3,251 @@
 HDHomeRun Emulator for Plex IPTV Integration
 This creates a simple HDHomeRun-compatible server that Plex can detect
 """
+import sys
 import json
+import gzip
 import time
+import hashlib
+import queue
+import socket
+import argparse
 import threading
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
 from urllib.parse import urlparse, parse_qs
+from typing import Dict, List, Optional, Tuple
 import requests
+from requests.adapters import HTTPAdapter
 import re
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "core"))
+
+from compression import GZIP, choose_encoding, representation_etag
+from content_manager import ContentManager
+from m3u import parse_m3u_text
+
+PLAYLIST_URL = "http://192.168.2.181:8080/master_playlist.m3u"
+
+# Forwarding buffer for proxied streams, a whole number of 188-byte TS packets
+STREAM_BUFFER_SIZE = 188 * 2048
+# (connect, read) timeouts for upstream streams
+UPSTREAM_TIMEOUT = (5, 30)
+# Socket timeout while sending a stream (longer than the keep-alive idle timeout)
+STREAM_SEND_TIMEOUT = 60
+
+def create_session(pool_size: int) -> requests.Session:
+    """HTTP session whose keep-alive connection pool is shared by every request handler"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def parse_lineup(text: str) -> List[Tuple[str, str, str]]:
+    """Return (tvg_id, name, url) for every playlist entry with an HTTP stream URL"""
+    entries = []
+    for entry in parse_m3u_text(text):
+        if entry.url.startswith("http"):
+            entries.append((entry.tvg_id, entry.name or f"Channel {len(entries) + 1}", entry.url))
+    return entries
+
+def lineup_entry(number: int, name: str, base_url: str) -> Dict:
+    return {
+        "GuideNumber": str(number),
+        "GuideName": name,
+        "URL": f"{base_url}/auto/v{number}"
+    }
+
+class LineupSnapshot:
+    """One version of the lineup: guide number lookup plus the serialized lineup.json"""
+    
+    def __init__(self, channels: List[Dict], base_url: str, version: int = 0):
+        self.version = version
+        self.urls: Dict[str, str] = {}
+        self.names: Dict[str, str] = {}
+        lineup = []
+        for channel in channels:
+            number, name, url = channel["number"], channel["name"], channel["url"]
+            self.urls[str(number)] = url
+            self.names[str(number)] = name
+            lineup.append(lineup_entry(number, name, base_url))
+        self.body = json.dumps(lineup).encode()
+        self.gzip_body = gzip.compress(self.body, 6)
+        self.etag = f'"{hashlib.sha1(self.body).hexdigest()[:16]}"'
+        self.loaded_at = time.time()
+
+class Lineup:
+    """Channel lineup held in memory and refreshed from the playlist in the background
+    
+    Refreshes are conditional requests, so an unchanged playlist (same
+    ETag or Last-Modified) costs a 304 instead of a full download, and an
+    unchanged body is not re-parsed. Guide numbers persist in the
+    database, so they survive playlist reorders and restarts. Readers
+    always see a complete snapshot; a refresh swaps in a new one in a
+    single assignment.
+    """
+    
+    def __init__(self, playlist_url: str, base_url: str, manager: ContentManager,
+                 refresh_interval: float = 300, session: Optional[requests.Session] = None):
+        self.playlist_url = playlist_url
+        self.manager = manager
+        self.base_url = base_url
+        self.refresh_interval = refresh_interval
+        self.session = session or requests.Session()
+        self.snapshot: Optional[LineupSnapshot] = None
+        self._validators: Dict[str, str] = {}
+        self._digest = None
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def refresh(self) -> bool:
+        """Reload the playlist if it changed; returns True when a new lineup was installed"""
+        response = self.session.get(self.playlist_url, headers=self._validators, timeout=30)
+        if response.status_code == 304:
+            return False
+        response.raise_for_status()
+        
+        validators = {}
+        if response.headers.get("ETag"):
+            validators["If-None-Match"] = response.headers["ETag"]
+        if response.headers.get("Last-Modified"):
+            validators["If-Modified-Since"] = response.headers["Last-Modified"]
+        self._validators = validators
+        
+        digest = hashlib.sha1(response.content).hexdigest()
+        if digest == self._digest:
+            return False
+        version = self.manager.sync_guide_numbers(parse_lineup(response.text))
+        self.snapshot = LineupSnapshot(self.manager.get_guide_numbers(), self.base_url, version)
+        self._digest = digest
+        return True
+    
+    def start(self):
+        """Load the lineup once, then keep refreshing it on a daemon thread"""
+        try:
+            self.refresh()
+            print(f"📺 Loaded {len(self.snapshot.urls)} channels from the playlist")
+        except Exception as e:
+            print(f"⚠️  Could not load the playlist yet, retrying in the background: {e}")
+        self._thread = threading.Thread(target=self._run, name="lineup-refresh", daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                if self.refresh():
+                    print(f"🔄 Lineup refreshed: {len(self.snapshot.urls)} channels")
+            except Exception as e:
+                print(f"Error refreshing lineup: {e}")
+    
+    def stop(self):
+        self._stop.set()
+
+class TunerPool:
+    """Fixed number of tuner slots; each proxied stream holds one while its client is connected"""
+    
+    def __init__(self, count: int):
+        self.count = count
+        self._slots: List[Optional[Dict]] = [None] * count
+        self._lock = threading.Lock()
+    
+    def acquire(self, guide_number: str, name: str, client: str) -> Optional[int]:
+        """Claim a free tuner for a channel; None when all are in use"""
+        with self._lock:
+            for index, slot in enumerate(self._slots):
+                if slot is None:
+                    self._slots[index] = {"number": guide_number, "name": name, "client": client,
+                                          "started": time.time(), "bytes": 0}
+                    return index
+        return None
+    
+    def slot(self, index: int) -> Dict:
+        return self._slots[index]
+    
+    def release(self, index: int):
+        with self._lock:
+            self._slots[index] = None
+    
+    def status(self) -> List[Dict]:
+        """Tuner usage in the shape of an HDHomeRun status.json"""
+        tuners = []
+        for index, slot in enumerate(list(self._slots)):
+            tuner = {"Resource": f"tuner{index}"}
+            if slot is not None:
+                elapsed = max(time.time() - slot["started"], 0.001)
+                tuner.update({
+                    "VctNumber": slot["number"],
+                    "VctName": slot["name"],
+                    "TargetIP": slot["client"],
+                    "Seconds": int(elapsed),
+                    "NetworkRate": int(slot["bytes"] * 8 / elapsed)
+                })
+            tuners.append(tuner)
+        return tuners
+
+class PooledHTTPServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer that handles connections on a bounded pool of worker threads
+    
+    Each connection is served on one worker for as long as it stays open,
+    so a slow request only holds up its own client. Connections beyond
+    the pool size wait for a free worker instead of spawning unbounded
+    threads. Workers are daemon threads and server_close() disconnects
+    every client, so a server stopped mid-stream never blocks exit.
+    """
+    
+    def __init__(self, server_address, handler_class, max_workers: int = 64):
+        super().__init__(server_address, handler_class)
+        self.max_workers = max_workers
+        self._pending: "queue.Queue[Optional[Tuple]]" = queue.Queue()
+        self._active = set()
+        self._active_lock = threading.Lock()
+        for index in range(max_workers):
+            threading.Thread(target=self._work, name=f"hdhomerun-{index}", daemon=True).start()
+    
+    def process_request(self, request, client_address):
+        self._pending.put((request, client_address))
+    
+    def _work(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+            request, client_address = item
+            with self._active_lock:
+                self._active.add(request)
+            try:
+                self.process_request_thread(request, client_address)
+            finally:
+                with self._active_lock:
+                    self._active.discard(request)
+    
+    def server_close(self):
+        super().server_close()
+        while True:
+            try:
+                item = self._pending.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                self.shutdown_request(item[0])
+        for _ in range(self.max_workers):
+            self._pending.put(None)
+        
+        # Wake workers blocked on a client socket; each closes its own connection
+        with self._active_lock:
+            active = list(self._active)
+        for request in active:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
 class HDHomeRunHandler(BaseHTTPRequestHandler):
+    # Keep-alive: Plex reuses its connection for discover/lineup polling
+    protocol_version = "HTTP/1.1"
+    # Each open connection holds a worker, so idle keep-alive connections are closed quickly
+    timeout = 5
+    
     def do_GET(self):
         """Handle GET requests"""
         parsed_path = urlparse(self.path)
@@ -23,6 +259,10 @@ class HDHomeRunHandler(BaseHTTPRequestHandler):
             self.send_lineup()
         elif path == '/lineup_status.json':
             self.send_lineup_status()
+        elif path == '/lineup_changes.json':
+            self.send_lineup_changes(parse_qs(parsed_path.query))
+        elif path == '/status.json':
+            self.send_json(self.server.tuners.status())
         elif path.startswith('/auto/v'):
             self.send_stream(parsed_path.path)
         else:
@@ -37,60 +277,73 @@ class HDHomeRunHandler(BaseHTTPRequestHandler):
             "FirmwareVersion": "20200101",
             "DeviceID": "12345678",
             "DeviceAuth": "test1234",
+            "TunerCount": self.server.tuners.count,
             "BaseURL": f"http://{self.server.server_address[0]}:{self.server.server_port}",
             "LineupURL": f"http://{self.server.server_address[0]}:{self.server.server_port}/lineup.json"
         }
-        
+        self.send_json(response)
+    
+    def send_json(self, payload):
+        """Send a small JSON response with an explicit length, as keep-alive requires"""
+        body = json.dumps(payload).encode()
         self.send_response(200)
         self.send_header('Content-type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
-        self.wfile.write(json.dumps(response).encode())
+        self.wfile.write(body)
     
     def send_lineup(self):
-        """Send channel lineup"""
-        try:
-            # Get the M3U playlist
-            playlist_url = "http://192.168.2.181:8080/master_playlist.m3u"
-            response = requests.get(playlist_url, timeout=10)
-            response.raise_for_status()
-            
-            channels = []
-            lines = response.text.splitlines()
-            i = 0
-            channel_num = 1
-            
-            while i < len(lines):
-                line = lines[i].strip()
-                if line.startswith("#EXTINF:"):
-                    # Extract channel name
-                    name_match = re.search(r',(.+)$', line)
-                    if name_match:
-                        name = name_match.group(1).strip()
-                        
-                        # Get the URL
-                        if i + 1 < len(lines):
-                            url = lines[i + 1].strip()
-                            if url.startswith("http"):
-                                channel = {
-                                    "GuideNumber": str(channel_num),
-                                    "GuideName": name,
-                                    "URL": f"http://{self.server.server_address[0]}:{self.server.server_port}/auto/v{channel_num}"
-                                }
-                                channels.append(channel)
-                                channel_num += 1
-                                i += 1  # Skip URL line
-                i += 1
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
+        """Send channel lineup from the pre-serialized snapshot"""
+        snapshot = self.server.lineup.snapshot
+        if snapshot is None:
+            self.send_error(503, "Lineup not loaded yet")
+            return
+        
+        # The gzip body is a different representation, so it gets its own strong ETag
+        encoding = choose_encoding(self.headers.get('Accept-Encoding'), [GZIP])
+        etag = representation_etag(snapshot.etag, encoding)
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(',')]:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Vary', 'Accept-Encoding')
             self.end_headers()
-            self.wfile.write(json.dumps(channels).encode())
-            
-        except Exception as e:
-            print(f"Error getting lineup: {e}")
-            self.send_error(500, "Internal Server Error")
+            return
+        
+        body = snapshot.gzip_body if encoding else snapshot.body
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('ETag', etag)
+        self.send_header('X-Lineup-Version', str(snapshot.version))
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def send_lineup_changes(self, query: Dict[str, List[str]]):
+        """Send the lineup entries changed and the guide numbers removed since ?since=<version>"""
+        snapshot = self.server.lineup.snapshot
+        if snapshot is None:
+            self.send_error(503, "Lineup not loaded yet")
+            return
+        try:
+            since = int(query.get('since', ['0'])[0])
+        except ValueError:
+            self.send_error(400, "since must be a lineup version number")
+            return
+        
+        changed, removed = [], []
+        base_url = self.server.lineup.base_url
+        for row in self.server.lineup.manager.get_lineup_changes(since):
+            if row["is_active"]:
+                changed.append(lineup_entry(row["number"], row["name"], base_url))
+            else:
+                removed.append(str(row["number"]))
+        self.send_json({"Version": snapshot.version, "Changed": changed, "Removed": removed})
     
     def send_lineup_status(self):
         """Send lineup status"""
@@ -100,72 +353,101 @@ class HDHomeRunHandler(BaseHTTPRequestHandler):
             "Source": "Cable",
             "SourceList": ["Cable"]
         }
+        self.send_json(response)
+    
+    def send_stream(self, path):
+        """Send stream (redirect to, or proxy, the actual IPTV stream)"""
+        channel_match = re.search(r'/auto/v(\d+)', path)
+        snapshot = self.server.lineup.snapshot
+        number = str(int(channel_match.group(1))) if channel_match else None
+        url = snapshot.urls.get(number) if number and snapshot else None
+        if url is None:
+            self.send_error(404, "Channel not found")
+            return
         
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
+        if self.server.proxy:
+            self.proxy_stream(number, snapshot.names[number], url)
+            return
+        
+        self.send_response(302)
+        self.send_header('Location', url)
+        self.send_header('Content-Length', '0')
         self.end_headers()
-        self.wfile.write(json.dumps(response).encode())
     
-    def send_stream(self, path):
-        """Send stream (proxy to actual IPTV stream)"""
+    def proxy_stream(self, number: str, name: str, url: str):
+        """Pipe the upstream stream to the client while holding a tuner slot"""
+        tuners = self.server.tuners
+        tuner = tuners.acquire(number, name, self.client_address[0])
+        if tuner is None:
+            # Same answer a real HDHomeRun gives, so Plex reports it properly
+            self.send_response(503, "All Tuners In Use")
+            self.send_header('X-HDHomeRun-Error', '805 All Tuners In Use')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        
         try:
-            # Extract channel number from path
-            channel_match = re.search(r'/auto/v(\d+)', path)
-            if not channel_match:
-                self.send_error(404, "Channel not found")
+            try:
+                upstream = self.server.session.get(url, stream=True, timeout=UPSTREAM_TIMEOUT)
+                upstream.raise_for_status()
+            except requests.RequestException as e:
+                print(f"Error opening channel {number}: {e}")
+                self.send_error(502, "Upstream unavailable")
                 return
             
-            channel_num = int(channel_match.group(1))
-            
-            # Get the actual stream URL from the playlist
-            playlist_url = "http://192.168.2.181:8080/master_playlist.m3u"
-            response = requests.get(playlist_url, timeout=10)
-            response.raise_for_status()
-            
-            lines = response.text.splitlines()
-            i = 0
-            current_channel = 1
-            
-            while i < len(lines):
-                line = lines[i].strip()
-                if line.startswith("#EXTINF:"):
-                    if i + 1 < len(lines):
-                        url = lines[i + 1].strip()
-                        if url.startswith("http"):
-                            if current_channel == channel_num:
-                                # Found the channel, redirect to the stream
-                                self.send_response(302)
-                                self.send_header('Location', url)
-                                self.end_headers()
-                                return
-                            current_channel += 1
-                            i += 1  # Skip URL line
-                i += 1
-            
-            self.send_error(404, "Channel not found")
-            
+            with upstream:
+                self.close_connection = True
+                self.send_response(200)
+                self.send_header('Content-type', upstream.headers.get('Content-Type', 'video/mp2t'))
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.connection.settimeout(STREAM_SEND_TIMEOUT)
+                self.forward(upstream.raw, tuners.slot(tuner))
+        finally:
+            tuners.release(tuner)
+    
+    def forward(self, source, slot: Dict):
+        """Copy source to the client through one reused buffer until either side closes"""
+        buffer = bytearray(STREAM_BUFFER_SIZE)
+        view = memoryview(buffer)
+        try:
+            while True:
+                count = source.readinto(buffer)
+                if not count:
+                    break
+                self.wfile.write(view[:count])
+                slot["bytes"] += count
         except Exception as e:
-            print(f"Error streaming channel: {e}")
-            self.send_error(500, "Internal Server Error")
+            # Client disconnected or upstream stalled/failed; the caller frees the tuner
+            print(f"Stream for channel {slot['number']} ended: {e}")
     
     def log_message(self, format, *args):
         """Override to reduce log noise"""
         pass
 
-def start_hdhomerun_emulator():
+def start_hdhomerun_emulator(playlist_url: str = PLAYLIST_URL, port: int = 6077,
+                             refresh_interval: float = 300, workers: int = 64,
+                             tuners: int = 2, proxy: bool = False, db_path: str = "iptv_content.db"):
     """Start the HDHomeRun emulator server"""
     print("🎬 Starting HDHomeRun Emulator for Plex IPTV Integration")
     print("=" * 60)
     
     # Create server
-    server_address = ('0.0.0.0', 6077)
-    httpd = HTTPServer(server_address, HDHomeRunHandler)
+    server_address = ('0.0.0.0', port)
+    httpd = PooledHTTPServer(server_address, HDHomeRunHandler, workers)
+    httpd.session = create_session(workers)
+    httpd.tuners = TunerPool(tuners)
+    httpd.proxy = proxy
+    httpd.manager = ContentManager(db_path)
+    httpd.lineup = Lineup(playlist_url, f"http://{httpd.server_address[0]}:{httpd.server_port}",
+                          httpd.manager, refresh_interval, httpd.session)
+    httpd.lineup.start()
     
-    print(f"🚀 HDHomeRun Emulator started on port 6077")
+    print(f"🚀 HDHomeRun Emulator started on port {port} with {workers} workers")
     print(f"📡 Plex can now detect this as an HDHomeRun device")
-    print(f"🔗 Add this URL in Plex: http://localhost:6077")
-    print(f"📺 Your IPTV playlist: http://192.168.2.181:8080/master_playlist.m3u")
+    print(f"🔗 Add this URL in Plex: http://localhost:{port}")
+    print(f"📺 Your IPTV playlist: {playlist_url} (refreshed every {refresh_interval:g}s)")
+    print(f"🎛️  {tuners} tuners, streams {'proxied' if proxy else 'redirected to the provider'}")
     print("\n⏹️  Press Ctrl+C to stop the server")
     print("=" * 60)
     
@@ -173,8 +455,26 @@ def start_hdhomerun_emulator():
         httpd.serve_forever()
     except KeyboardInterrupt:
         print("\n🛑 Stopping HDHomeRun Emulator...")
-        httpd.shutdown()
+        httpd.lineup.stop()
+        httpd.server_close()
+        httpd.session.close()
+        httpd.manager.close()
         print("✅ HDHomeRun Emulator stopped")
 
+def main():
+    parser = argparse.ArgumentParser(description="HDHomeRun emulator for Plex IPTV integration")
+    parser.add_argument("--playlist-url", default=PLAYLIST_URL, help="M3U playlist to serve as the lineup")
+    parser.add_argument("--port", type=int, default=6077, help="port to listen on")
+    parser.add_argument("--db", default="iptv_content.db", help="database that keeps the guide numbers")
+    parser.add_argument("--refresh-interval", type=float, default=300,
+                        help="seconds between playlist change checks")
+    parser.add_argument("--workers", type=int, default=64, help="concurrent connection handler threads")
+    parser.add_argument("--tuners", type=int, default=2, help="tuner count advertised to Plex")
+    parser.add_argument("--proxy", action="store_true",
+                        help="pipe streams through the emulator and enforce the tuner count")
+    args = parser.parse_args()
+    start_hdhomerun_emulator(args.playlist_url, args.port, args.refresh_interval, args.workers,
+                             args.tuners, args.proxy, args.db)
+
 if __name__ == "__main__":
-    start_hdhomerun_emulator()
+    main()
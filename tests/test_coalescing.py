@@ -0,0 +1,64 @@
+"""
+Request coalescing tests for the catalog API
+Concurrent identical requests must share a single database query
+"""
+
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src" / "core"))
+
+import main
+from coalescing import build_flights
+
+class CountingManager:
+    """Stands in for ContentManager: a slow get_channels that counts its calls"""
+
+    def __init__(self, delay: float = 0.2):
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def get_catalog_version(self):
+        return 1, "2026-01-01 00:00:00"
+
+    def get_channels(self, **kwargs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return [{"id": 1, "name": "News One", "url": "http://example.com/1.ts"}]
+
+async def fetch_concurrently(paths):
+    # ASGITransport skips the lifespan, so app.state is set up by the test instead
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await asyncio.gather(*(client.get(path) for path in paths))
+
+def use_manager(manager):
+    main.app.state.content_manager = manager
+    main.app.state.flights = build_flights({}, main.CONCURRENCY_LIMITS)
+
+def test_concurrent_identical_requests_share_one_query():
+    manager = CountingManager()
+    use_manager(manager)
+
+    responses = asyncio.run(fetch_concurrently(["/api/channels?category=news"] * 20))
+
+    assert [response.status_code for response in responses] == [200] * 20
+    assert all(response.json() == responses[0].json() for response in responses)
+    assert manager.calls == 1
+
+def test_distinct_requests_are_not_shared():
+    manager = CountingManager()
+    use_manager(manager)
+
+    responses = asyncio.run(fetch_concurrently(["/api/channels?category=news",
+                                                "/api/channels?category=sports"] * 5))
+
+    assert [response.status_code for response in responses] == [200] * 10
+    assert manager.calls == 2
@@ -0,0 +1,45 @@
+"""
+Now/next guide index tests
+The index must follow channel writes as well as guide imports
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src" / "core"))
+
+from content_manager import ContentManager
+from guide_index import GuideIndex
+
+def airing_programme(channel_id, now):
+    return {"channel_id": channel_id, "start": now - 600, "stop": now + 600, "title": "News at Ten"}
+
+def test_channel_imported_after_the_guide_gets_its_programmes(tmp_path):
+    manager = ContentManager(str(tmp_path / "guide.db"))
+    now = int(time.time())
+    manager.replace_programmes([airing_programme("bbc.uk", now)])
+    index = GuideIndex(manager)
+    asyncio.run(index.ensure_current())
+    assert index.now(["bbc.uk"], at=now) == {"bbc.uk": None}
+
+    manager.add_channels([{"name": "BBC One", "url": "http://example.com/bbc.ts", "tvg_id": "bbc.uk"}])
+    asyncio.run(index.ensure_current())
+
+    assert index.now(["bbc.uk"], at=now)["bbc.uk"]["title"] == "News at Ten"
+    manager.close()
+
+def test_channel_matched_to_a_guide_id_gets_its_programmes(tmp_path):
+    manager = ContentManager(str(tmp_path / "guide.db"))
+    now = int(time.time())
+    [channel_id] = manager.add_channels([{"name": "BBC One", "url": "http://example.com/bbc.ts"}])
+    manager.replace_programmes([airing_programme("bbc.uk", now)])
+    index = GuideIndex(manager)
+    asyncio.run(index.ensure_current())
+
+    manager.set_tvg_matches([(channel_id, "bbc.uk", 0.95, "BBC One")])
+    asyncio.run(index.ensure_current())
+
+    assert index.now(["bbc.uk"], at=now)["bbc.uk"]["title"] == "News at Ten"
+    manager.close()